@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""
+Simulation engines BioSim can run on. All engines have the same methods
+to step the island one year, add animals and get statistics, so a
+simulation can be run on the fast engines and checked against the
+reference engine.
+The reference engine runs every cell through the whole year before the
+next cell as the original simulation did, the array engine runs each
+phase of the year for all cells at once and the parallel engine splits
+the island between worker processes
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+from biosim.island import Island
+from biosim.parallel import ParallelIsland
+from biosim.population import Population
+
+
+class Engine:
+    """
+    Engine running an island. Subclasses create the island in make_island
+    """
+
+    def __init__(self, island_map, seed=None, **options):
+        """
+        :param island_map: Multi-line string specifying island geography
+        :param seed: Integer used as random number seed
+        :param options: options of the island, see make_island of the
+        engine
+        """
+        self.island = self.make_island(island_map, seed, **options)
+        self.map_dims = self.island.map_dims
+
+    def make_island(self, island_map, seed):
+        """
+        :return: island the engine runs
+        """
+        raise NotImplementedError
+
+    def step(self):
+        """
+        Simulates one year
+        """
+        self.island.life_cycle()
+
+    def add_population(self, population):
+        """
+        Adds animals to the island
+        :param population: list of dictionaries with loc and pop
+        """
+        self.island.add_animals(population)
+
+    def num_animals_per_species(self):
+        """
+        :return: dictionary with number of animals of each species
+        """
+        return {species: self.island.total_animals_per_species(species)
+                for species in Population.species_codes}
+
+    def census(self):
+        """
+        Number of animals of each species in every cell
+        :return: array of shape (species, rows, columns), species in the
+        order of Population.species_codes
+        """
+        return self.island.census()
+
+    def fodder_grid(self):
+        """
+        :return: array of map shape with fodder of every cell
+        """
+        return self.island.fodder_grid()
+
+    def population_arrays(self):
+        """
+        :return: dictionary with columns of all living animals, see
+        Island.population_arrays
+        """
+        return self.island.population_arrays()
+
+    def get_state(self):
+        """
+        :return: dictionary of arrays with the state of the island, see
+        Island.get_state
+        """
+        return self.island.get_state()
+
+    def set_state(self, state):
+        """
+        Puts the island back into a state from get_state
+        :param state: dictionary of arrays
+        """
+        self.island.set_state(state)
+
+    def close(self):
+        """
+        Frees the resources of the engine
+        """
+
+
+class ReferenceEngine(Engine):
+    """
+    Engine running every cell through all phases of the year before the
+    next cell, used to validate the other engines
+    """
+
+    def make_island(self, island_map, seed, kernel_backend=None):
+        """
+        :param kernel_backend: 'python' or 'numba', see Island
+        :return: Island in cell order
+        """
+        return Island(island_map, seed=seed, update_order='cell',
+                      kernel_backend=kernel_backend)
+
+
+class ArrayEngine(Engine):
+    """
+    Engine running each phase of the year on all cells at once with the
+    array kernels
+    """
+
+    def make_island(self, island_map, seed, update_order='phase',
+                    kernel_backend=None):
+        """
+        :param update_order: 'phase' or 'cell', see Island
+        :param kernel_backend: 'python' or 'numba', see Island
+        :return: Island
+        """
+        return Island(island_map, seed=seed, update_order=update_order,
+                      kernel_backend=kernel_backend)
+
+
+class ParallelEngine(Engine):
+    """
+    Engine splitting the island between worker processes
+    """
+
+    def make_island(self, island_map, seed, num_workers=None,
+                    rebalance_every=None, kernel_backend=None):
+        """
+        :param num_workers: number of worker processes
+        :param rebalance_every: years between redistributing the cells
+        :param kernel_backend: 'python' or 'numba', see Island
+        :return: ParallelIsland
+        """
+        return ParallelIsland(island_map, seed=seed, num_workers=num_workers,
+                              rebalance_every=rebalance_every,
+                              kernel_backend=kernel_backend)
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        self.island.close()
+
+
+engines = {'reference': ReferenceEngine,
+           'array': ArrayEngine,
+           'parallel': ParallelEngine}
+
+
+def create_engine(name, island_map, seed=None, **options):
+    """
+    Creates an engine by name
+    :param name: 'reference', 'array' or 'parallel'
+    :param island_map: Multi-line string specifying island geography
+    :param seed: Integer used as random number seed
+    :param options: options of the engine
+    :return: Engine
+    """
+    if name not in engines:
+        raise ValueError('Unknown engine ' + str(name))
+    return engines[name](island_map, seed, **options)
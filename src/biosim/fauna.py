@@ -8,32 +8,88 @@ __email__ = "hesa@nmbu.no & misi@nmbu.no"
 import math
 import numpy as np
 
+from biosim.population import Population
+
 
 class Fauna:
     """
     Fauna Base Class for Herbivore and Carnivore
+    Age and weight of an animal live in a row of a Population store,
+    the object itself is only a view into that row
     """
     parameters = {}
+    parameter_version = 0
 
-    def __init__(self, age=None, weight=None):
+    def __init__(self, age=None, weight=None, population=None):
         """
         Constructor for base class
         weight of the animal at birth is calculated accordingly
         :param age: age is of type integer
         :param weight: weight can be floating point value
+        :param population: Population store the animal is added to,
+        animals created without one get a store of their own
         """
+        if population is None:
+            population = Population(capacity=1)
+        self.population = population
         if age is None:
-            self.age = 0
-        else:
-            self.age = age
+            age = 0
         if weight is None:
-            self.weight = np.random.normal(self.parameters['w_birth'],
-                                           self.parameters['sigma_birth'])
-        else:
-            self.weight = weight
+            weight = np.random.normal(self.parameters['w_birth'],
+                                      self.parameters['sigma_birth'])
+        self.row = self.population.add(self.__class__.__name__, age, weight)
         self.fitness = 0
         self.gives_birth = False
-        self.is_animal_moved_already = False
+
+    @classmethod
+    def view(cls, population, row):
+        """
+        Creates an object for an animal which is already in the store
+        :param population: Population store holding the animal
+        :param row: row index of the animal in the store
+        :return: Herbivore or Carnivore object
+        """
+        animal = cls.__new__(cls)
+        animal.population = population
+        animal.row = int(row)
+        animal.fitness = 0
+        animal.gives_birth = False
+        return animal
+
+    def __eq__(self, other):
+        return isinstance(other, Fauna) and \
+            self.population is other.population and self.row == other.row
+
+    def __hash__(self):
+        return hash((id(self.population), self.row))
+
+    @property
+    def age(self):
+        """
+
+        :return: age of the animal
+        """
+        return int(self.population.age[self.row])
+
+    @age.setter
+    def age(self, value):
+        self.population.age[self.row] = value
+        self.population.fitness[self.row] = np.nan
+        self.population.revision += 1
+
+    @property
+    def weight(self):
+        """
+
+        :return: weight of the animal
+        """
+        return float(self.population.weight[self.row])
+
+    @weight.setter
+    def weight(self, value):
+        self.population.weight[self.row] = value
+        self.population.fitness[self.row] = np.nan
+        self.population.revision += 1
 
     @property
     def animal_weight(self):
@@ -74,7 +130,20 @@ class Fauna:
     @property
     def animal_fitness(self):
         """
-        Calculates and returns fitness value of animal.
+        Returns fitness value of animal.
+        The value is cached in the population store and only recalculated
+        after age, weight or parameters of the species have changed
+        """
+        self.check_parameter_version(self.population)
+        fitness = self.population.fitness[self.row]
+        if fitness != fitness:
+            fitness = self.calculate_fitness()
+            self.population.fitness[self.row] = fitness
+        return float(fitness)
+
+    def calculate_fitness(self):
+        """
+        Calculates fitness value of animal.
         It is calculated by the formula given in instructions
         Phi = q(-1, a, a_half, phi_age)*q(+1, w, w_half, phi_weight)
         Uses parameters phi_age, a_half, phi_weight, w_half to calculate
@@ -89,6 +158,72 @@ class Fauna:
         else:
             return 0
 
+    @classmethod
+    def compute_fitness(cls, age, weight):
+        """
+        Array version of calculate_fitness for many animals of the species
+        :param age: array of ages
+        :param weight: array of weights
+        :return: array of fitness values
+        """
+        with np.errstate(over='ignore'):
+            q_age = 1 / (1 + np.exp(cls.parameters['phi_age'] *
+                                    (age - cls.parameters['a_half'])))
+            q_weight = 1 / (1 + np.exp(-1 * (cls.parameters['phi_weight'] *
+                                             (weight -
+                                              cls.parameters['w_half']))))
+        return np.where(weight > 0, q_age * q_weight, 0.0)
+
+    @classmethod
+    def cached_fitness(cls, population, rows):
+        """
+        Fitness of many animals of the species, only animals whose
+        cached value is out of date are recalculated
+        :param population: Population store holding the animals
+        :param rows: row indices of the animals
+        :return: array of fitness values
+        """
+        cls.check_parameter_version(population)
+        fitness = population.fitness[rows]
+        dirty = np.isnan(fitness)
+        if dirty.any():
+            dirty_rows = rows[dirty]
+            fitness[dirty] = cls.compute_fitness(population.age[dirty_rows],
+                                                 population.weight[dirty_rows])
+            population.fitness[dirty_rows] = fitness[dirty]
+        return fitness
+
+    @classmethod
+    def check_parameter_version(cls, population):
+        """
+        Drops the cached fitness of the species in population if the
+        parameters were changed since it was calculated
+        :param population: Population store holding the animals
+        """
+        species = cls.__name__
+        if population.parameter_versions.get(species) != \
+                cls.parameter_version:
+            code = population.species_codes[species]
+            population.fitness[population.species == code] = np.nan
+            population.parameter_versions[species] = cls.parameter_version
+
+    def can_give_birth(self, num_animals):
+        """
+        Animal can give birth only if atleast 2 animals of same species are
+        in cell and it is heavy enough
+        :param num_animals: Number of animals of same species in cell
+        """
+        return num_animals >= 2 and self.weight >= self.parameters['zeta'] * \
+            (self.parameters['w_birth'] + self.parameters['sigma_birth'])
+
+    def birth_probability(self, num_animals):
+        """
+        Returns the probability with which animal gives birth
+        :param num_animals: Number of animals of same species in cell
+        """
+        return min(1, self.parameters['gamma'] * self.animal_fitness *
+                   (num_animals - 1))
+
     def probability_of_birth(self, num_animals):
         """
         Probability by which animal gives birth is calculated
@@ -96,11 +231,8 @@ class Fauna:
         in cell
         :param num_animals: Number of animals of same species in cell
         """
-        if num_animals >= 2 and self.weight >= self.parameters['zeta'] * \
-                (self.parameters['w_birth'] + self.parameters['sigma_birth']):
-            return np.random.random() < min(1, self.parameters['gamma'] *
-                                            self.animal_fitness *
-                                            (num_animals - 1))
+        if self.can_give_birth(num_animals):
+            return np.random.random() < self.birth_probability(num_animals)
         else:
             return False
 
@@ -113,6 +245,13 @@ class Fauna:
             self.weight -= offspring.weight * offspring.parameters['xi']
         self.gives_birth = True
 
+    @property
+    def death_probability(self):
+        """
+        Returns the probability with which animal dies
+        """
+        return self.parameters['omega'] * (1 - self.animal_fitness)
+
     @property
     def probability_of_death(self):
         """
@@ -122,15 +261,21 @@ class Fauna:
         if self.animal_fitness == 0:
             return False
         else:
-            return np.random.random() < self.parameters['omega'] * \
-                   (1 - self.animal_fitness)
+            return np.random.random() < self.death_probability
+
+    @property
+    def move_probability(self):
+        """
+        Returns the probability with which animal moves
+        """
+        return self.parameters['mu'] * self.animal_fitness
 
     @property
     def probability_of_move(self):
         """
         To know if animal moves
         """
-        return np.random.random() < self.parameters['mu'] * self.animal_fitness
+        return np.random.random() < self.move_probability
 
     @classmethod
     def set_parameters(cls, given_params):
@@ -147,6 +292,7 @@ class Fauna:
                     cls.parameters[param] = given_params[param]
             else:
                 raise ValueError('Parameter not in class parameter list')
+        cls.parameter_version += 1
 
 
 class Carnivore(Fauna):
@@ -160,8 +306,8 @@ class Carnivore(Fauna):
                   'xi': 1.1, 'omega': 0.9, 'F': 50.0,
                   'DeltaPhiMax': 10.0}
 
-    def __init__(self, age=None, weight=None):
-        super().__init__(age, weight)
+    def __init__(self, age=None, weight=None, population=None):
+        super().__init__(age, weight, population)
         self.parameters = Carnivore.parameters
 
     def probability_of_kill(self, herb):
@@ -193,6 +339,6 @@ class Herbivore(Fauna):
                   'lambda': 1.0, 'gamma': 0.2, 'zeta': 3.5,
                   'xi': 1.2, 'omega': 0.4, 'F': 10.0}
 
-    def __init__(self, age=None, weight=None):
-        super().__init__(age, weight)
+    def __init__(self, age=None, weight=None, population=None):
+        super().__init__(age, weight, population)
         self.parameters = Herbivore.parameters
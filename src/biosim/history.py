@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+History of the population over the years. Every year the columns of all
+living animals are appended to one binary file per column, and an index
+file gets the year, the offset of its first animal and the number of
+animals. Nothing is kept in memory while recording.
+PopulationHistory maps the files into memory, so the animals of one year
+can be read without loading the whole history
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import os
+
+import numpy as np
+
+history_columns = {'species': np.int8,
+                   'cell': np.int64,
+                   'age': np.int64,
+                   'weight': np.float64,
+                   'fitness': np.float64}
+
+
+class HistoryRecorder:
+    """
+    Appends the population of every recorded year to the files of a
+    directory
+    """
+
+    def __init__(self, directory, keep_until=None):
+        """
+        :param directory: directory of the history, it is created if
+        needed and a history already in it is replaced
+        :param keep_until: year up to which a history already in the
+        directory is kept and appended to, later years are dropped. Used
+        when a simulation goes on from a checkpoint
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        index_path = os.path.join(directory, 'index.bin')
+        index = np.empty((0, 3), dtype=np.int64)
+        if keep_until is not None and os.path.exists(index_path):
+            index = np.fromfile(index_path, dtype=np.int64).reshape(-1, 3)
+            index = index[index[:, 0] <= keep_until]
+        self.num_animals = int((index[:, 1] + index[:, 2]).max(initial=0))
+        self._files = {}
+        for name, dtype in history_columns.items():
+            file = open(os.path.join(directory, name + '.bin'), 'ab')
+            file.truncate(self.num_animals * np.dtype(dtype).itemsize)
+            self._files[name] = file
+        self._index = open(index_path, 'ab')
+        self._index.truncate(index.nbytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, year, arrays):
+        """
+        Appends the animals of a year. The columns are written before the
+        index, so the index only points to animals which are in the files
+        :param year: year of the population
+        :param arrays: dictionary with a column of all animals for every
+        name in history_columns, see Island.population_arrays
+        """
+        num_animals = len(arrays['species'])
+        for name, dtype in history_columns.items():
+            file = self._files[name]
+            file.write(np.asarray(arrays[name], dtype=dtype).tobytes())
+            file.flush()
+        self._index.write(np.array([year, self.num_animals, num_animals],
+                                   dtype=np.int64).tobytes())
+        self._index.flush()
+        self.num_animals += num_animals
+
+    def close(self):
+        """
+        Closes the files
+        """
+        for file in self._files.values():
+            file.close()
+        self._index.close()
+
+
+class PopulationHistory:
+    """
+    Reads a history written by HistoryRecorder through memory maps
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory of the history
+        """
+        index = np.fromfile(os.path.join(directory, 'index.bin'),
+                            dtype=np.int64).reshape(-1, 3)
+        self.years, self.offsets, self.counts = index.T
+        num_animals = int((self.offsets + self.counts).max(initial=0))
+        self._columns = {}
+        for name, dtype in history_columns.items():
+            if num_animals == 0:
+                self._columns[name] = np.empty(0, dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(
+                    os.path.join(directory, name + '.bin'), dtype=dtype,
+                    mode='r', shape=(num_animals,))
+
+    def __len__(self):
+        """
+        :return: number of recorded years
+        """
+        return len(self.years)
+
+    def year(self, year):
+        """
+        Animals living in a recorded year
+        :param year: year of the simulation
+        :return: dictionary with a read-only array for every column
+        """
+        position = np.flatnonzero(self.years == year)
+        if len(position) == 0:
+            raise ValueError('Year {} is not in the history'.format(year))
+        start = self.offsets[position[-1]]
+        stop = start + self.counts[position[-1]]
+        return {name: column[start:stop]
+                for name, column in self._columns.items()}
@@ -11,15 +11,44 @@ __email__ = "hesa@nmbu.no & misi@nmbu.no"
 
 from biosim.landscape import *
 import numpy as np
+from biosim import kernels
 from biosim.fauna import Herbivore, Carnivore
+from biosim.population import Population
+from biosim.randomness import spawn_streams
 
 
 class Island:
     """
     This is to represent the given map string as a array of objects
     """
-    def __init__(self, island_map):
+    update_orders = ('phase', 'cell')
+    state_columns = ('age', 'weight', 'fitness')
+
+    def __init__(self, island_map, seed=None, update_order='phase',
+                 kernel_backend=None):
+        """
+        :param island_map: Multi-line string specifying island geography
+        :param seed: Integer used as random number seed. Every cell gets its
+        own random stream spawned from it, without seed cells draw from the
+        global numpy random state
+        :param update_order: 'phase' runs every phase of the year for all
+        cells before the next phase, 'cell' runs all phases for one cell
+        before the next cell as the original simulation did
+        :param kernel_backend: 'python' or 'numba', kernels used by the
+        island and its cells, see kernels.kernel_set. None uses
+        kernels.default_kernels, selected with kernels.set_backend
+        """
+        if update_order not in self.update_orders:
+            raise ValueError('Unknown update order ' + str(update_order))
+        self.update_order = update_order
+        if kernel_backend is None:
+            self.kernel_backend = kernels.default_backend
+            self.kernels = kernels.default_kernels
+        else:
+            self.kernel_backend, self.kernels = kernels.kernel_set(
+                kernel_backend)
         self.map = island_map
+        self.seed = seed
         self.island_map = self.string_to_array()
         self.check_surrounded_by_ocean(self.island_map)
 
@@ -30,6 +59,7 @@ class Island:
                                'J': Jungle}
         self.fauna_dict = {'Herbivore': Herbivore,
                            'Carnivore': Carnivore}
+        self.population = Population(num_cells=self.island_map.size)
 
         self._cells = self.create_array_with_landscape_objects()
 
@@ -37,6 +67,12 @@ class Island:
         cols = self._cells.shape[1]
         self.map_dims = rows, cols
 
+        self.flat_cells = self._cells.ravel()
+        self.cell_ids, self.neighbours = self.neighbour_table(self.map_dims)
+        self.migratable = np.array([cell.is_migratable
+                                    for cell in self.flat_cells])
+        self.year = 0
+
     @property
     def cells(self):
         """
@@ -80,15 +116,42 @@ class Island:
         """
         To create an array of same size of the map but with
         objects of the classes according to the Cell letter
+        Every cell keeps its animals in the population store of the island
+        and knows its flat index in the map
         :return: Array with landscape objects
         """
         cell_type_array = np.empty(self.island_map.shape, dtype=object)
+        cols = self.island_map.shape[1]
+        if self.seed is not None:
+            streams = spawn_streams(self.seed, self.island_map.size)
         for row in np.arange(self.island_map.shape[0]):
-            for col in np.arange(self.island_map.shape[1]):
+            for col in np.arange(cols):
                 cell_type = self.island_map[row][col]
-                cell_type_array[row][col] = self.landscape_dict[cell_type]()
+                cell = self.landscape_dict[cell_type](
+                    population=self.population)
+                cell.cell_id = int(row * cols + col)
+                cell.kernels = self.kernels
+                if self.seed is not None:
+                    cell.rng = streams[cell.cell_id]
+                cell_type_array[row][col] = cell
         return cell_type_array
 
+    @staticmethod
+    def neighbour_table(map_dims):
+        """
+        Flat index of every cell and of its neighbours
+        :param map_dims: number of rows and cols of the map
+        :return: array of map shape with flat index of cells and array of
+        shape (number of cells, 4) with flat index of the cell above,
+        below, left and right of each cell, -1 outside the map
+        """
+        cell_ids = np.arange(map_dims[0] * map_dims[1]).reshape(map_dims)
+        padded = np.pad(cell_ids, 1, constant_values=-1)
+        neighbours = np.stack((padded[:-2, 1:-1], padded[2:, 1:-1],
+                               padded[1:-1, :-2], padded[1:-1, 2:]),
+                              axis=-1).reshape(-1, 4)
+        return cell_ids, neighbours
+
     def adjacent_cells(self, hor, ver):
         """
         This is to get the immediate adjacent cells of cell (hor, ver)
@@ -96,69 +159,428 @@ class Island:
         :param ver: Number of cols
         :return: List with the 4 adj cells
         """
-        rows, cols = self.map_dims
-        adj_cell_list = []
-        if hor > 0:
-            adj_cell_list.append(self._cells[hor - 1, ver])
-        if hor + 1 < rows:
-            adj_cell_list.append(self._cells[hor + 1, ver])
-        if ver > 0:
-            adj_cell_list.append(self._cells[hor, ver - 1])
-        if ver + 1 < cols:
-            adj_cell_list.append(self._cells[hor, ver + 1])
-        return adj_cell_list
+        return [self.flat_cells[cell_id]
+                for cell_id in self.neighbours[self.cell_ids[hor, ver]]
+                if cell_id >= 0]
 
     def add_animals(self, pop):
         """
         This is to add animals to the cells
+        Animals of one species in one location are added to the
+        population store in one go
         :param pop: Number of animals to add
         """
         for animal_group in pop:
-            loc = animal_group['loc']
-            animals = animal_group['pop']
-            for animal in animals:
+            cell = self._cells[animal_group['loc']]
+            groups = {}
+            for animal in animal_group['pop']:
                 species = animal['species']
-                age = animal['age']
-                weight = animal['weight']
-                species_class = self.fauna_dict[species]
-                animal_object = species_class(age=age, weight=weight)
-                cell = self._cells[loc]
-                cell.add_animal(animal_object)
+                if species not in self.fauna_dict:
+                    raise ValueError('Unknown species ' + str(species))
+                groups.setdefault(species, []).append(animal)
+            for species, animals in groups.items():
+                rows = self.population.add_many(
+                    species,
+                    [animal['age'] for animal in animals],
+                    [animal['weight'] for animal in animals])
+                cell.add_rows(species, rows)
+
+    def get_state(self, cell_ids=None):
+        """
+        State of cells as flat arrays: fodder, random streams and the
+        columns of their animals in the order the cells hold them
+        :param cell_ids: flat indices of the cells, default is all cells
+        animals can live in
+        :return: dictionary of arrays
+        """
+        if cell_ids is None:
+            cell_ids = np.flatnonzero(self.migratable)
+        cells = self.flat_cells[cell_ids]
+        streams = [cell.rng.get_state() for cell in cells]
+        animals = {name: [np.empty(0, dtype=Population.columns[name][0])]
+                   for name in ('species', 'cell') + self.state_columns}
+        for cell in cells:
+            for species, rows in cell.fauna_rows.items():
+                animals['species'].append(np.full(
+                    len(rows), Population.species_codes[species],
+                    dtype=np.int8))
+                animals['cell'].append(np.full(len(rows), cell.cell_id))
+                for name in self.state_columns:
+                    animals[name].append(getattr(self.population, name)[rows])
+        state = {'year': self.year,
+                 'cell_ids': np.asarray(cell_ids),
+                 'fodder': np.array([cell._remaining_food['Herbivore']
+                                     for cell in cells], dtype=float),
+                 'fodder_year': np.array([cell.fodder_year
+                                          for cell in cells], dtype=int),
+                 'rng_generator': np.array([stream['generator']
+                                            for stream in streams]),
+                 'rng_num_uniforms': np.array([len(stream['uniforms'])
+                                               for stream in streams],
+                                              dtype=int),
+                 'rng_num_normals': np.array([len(stream['normals'])
+                                              for stream in streams],
+                                             dtype=int)}
+        for name in ('uniforms', 'normals'):
+            state['rng_' + name] = np.concatenate(
+                [np.empty(0)] + [stream[name] for stream in streams])
+        for name, values in animals.items():
+            state['animal_' + name] = np.concatenate(values)
+        return state
+
+    def set_state(self, state, cell_ids=None):
+        """
+        Puts cells back into a state from get_state, the animals they hold
+        are replaced by the saved animals
+        :param state: dictionary of arrays from get_state
+        :param cell_ids: flat indices of the cells to restore, default is
+        all cells in state
+        """
+        self.year = int(state['year'])
+        self.population.year = self.year
+        saved_ids = state['cell_ids']
+        if cell_ids is None:
+            cell_ids = saved_ids
+        uniforms = np.split(state['rng_uniforms'],
+                            np.cumsum(state['rng_num_uniforms'])[:-1])
+        normals = np.split(state['rng_normals'],
+                           np.cumsum(state['rng_num_normals'])[:-1])
+        for index in np.flatnonzero(np.isin(saved_ids, cell_ids)):
+            cell = self.flat_cells[saved_ids[index]]
+            cell._remaining_food['Herbivore'] = float(state['fodder'][index])
+            cell.fodder_year = int(state['fodder_year'][index])
+            cell.rng.set_state({'generator': state['rng_generator'][index],
+                                'uniforms': uniforms[index],
+                                'normals': normals[index]})
+            for species, rows in cell.fauna_rows.items():
+                self.population.kill(rows)
+                cell.set_fauna_rows(species, np.empty(0, dtype=int))
+
+        restored = np.flatnonzero(np.isin(state['animal_cell'], cell_ids))
+        species_codes = state['animal_species'][restored]
+        cells = state['animal_cell'][restored]
+        starts = np.flatnonzero((np.diff(species_codes) != 0) |
+                                (np.diff(cells) != 0)) + 1
+        species_names = list(Population.species_codes)
+        for group in np.split(restored, starts):
+            if len(group) == 0:
+                continue
+            species = species_names[state['animal_species'][group[0]]]
+            rows = self.population.add_many(species,
+                                            state['animal_age'][group],
+                                            state['animal_weight'][group])
+            for name in self.state_columns:
+                getattr(self.population, name)[rows] = \
+                    state['animal_' + name][group]
+            self.flat_cells[state['animal_cell'][group[0]]].add_rows(species,
+                                                                     rows)
+        # after the first year every cell takes its breeding animals from
+        # its own animals, see feed_and_breed
+        if self.year >= 1:
+            for cell in self.flat_cells[self.migratable]:
+                cell.add_offspring_to_adult_animals()
+
+    def population_arrays(self):
+        """
+        Columns of all living animals with their age, weight and fitness.
+        Nothing in the population store is changed, so recording the
+        population does not change the simulation
+        :return: dictionary with arrays species, cell, age, weight and
+        fitness
+        """
+        rows = self.population.rows
+        age = self.population.age[rows]
+        weight = self.population.weight[rows]
+        species = self.population.species[rows]
+        fitness = np.empty(len(rows))
+        for name, code in Population.species_codes.items():
+            chosen = species == code
+            fitness[chosen] = self.fauna_dict[name].compute_fitness(
+                age[chosen], weight[chosen])
+        return {'species': species, 'cell': self.population.cell[rows],
+                'age': age, 'weight': weight, 'fitness': fitness}
 
     def total_animals_per_species(self, species):
         """
-        To get total number of Herbivores and Carnivores in all cells
+        To get total number of Herbivores and Carnivores in all cells, the
+        population store keeps count so no cell is visited
         :param species: Herbivore or Carnivore object
         """
-        num_animals = 0
-        rows, cols = self.map_dims
-        for hor in range(rows):
-            for ver in range(cols):
-                cell = self._cells[hor, ver]
-                num_animals += len(cell.fauna_list[species])
-        return num_animals
+        return int(self.population.species_counts[
+            Population.species_codes[species]])
+
+    def active_cell_ids(self):
+        """
+        Flat index of the populated cells animals can live in
+        :return: sorted array of cell indices
+        """
+        cell_ids = np.fromiter(self.population.active_cells, dtype=int,
+                               count=len(self.population.active_cells))
+        cell_ids.sort()
+        return cell_ids[self.migratable[cell_ids]]
 
     def life_cycle(self):
         """
         This iterates through all the cells and performs life cycle events
         this should be called every year
+        In phase order all animals eat, then all animals give birth, then
+        all animals on the island migrate at once, then all animals age
+        and then die. In cell order every cell runs all phases before the
+        next cell, animals moving to a later cell then run them again and
+        animals moving to an earlier cell miss the rest of the year.
+        Only populated cells are visited, fodder of the other cells grows
+        back lazily when it is needed
         """
         print('New Year')
-        self.reset_migration_flag()
-        rows, cols = self.map_dims
-        for row in range(rows):
-            for col in range(cols):
-                if self._cells[row, col].is_migratable:
-                    self._cells[row, col].animal_eats()
-                    self._cells[row, col].animals_gives_birth()
-                    self._cells[row, col].add_offspring_to_adult_animals()
-                    self._cells[row, col].animal_migrates(
-                        self.adjacent_cells(row, col))
-                    self._cells[row, col].grow_all_animals()
-                    self._cells[row, col].animal_dies()
-
-    def reset_migration_flag(self):
-        rows, cols = self.map_dims
-        for row in range(rows):
-            for col in range(cols):
-                self._cells[row, col].reset_migration_flag()
+        if self.update_order == 'cell':
+            self.cell_major_year()
+            return
+        self.feed_and_breed()
+        self.migrate_animals()
+        self.grow_and_die()
+
+    def cell_major_year(self):
+        """
+        One year in cell order, the migration of each cell moves animals
+        into the neighbour cells at once. Animals which moved are marked
+        with the year in the store so they do not move again in their new
+        cell.
+        Empty cells are skipped, so before animals move the fodder of the
+        neighbours is grown back to what it was when every cell was visited:
+        grown for this year in neighbours before the cell, up to last year
+        in neighbours after it
+        """
+        self.year += 1
+        for cell_id in np.flatnonzero(self.migratable):
+            cell = self.flat_cells[cell_id]
+            if not any(len(rows) for rows in cell.fauna_rows.values()):
+                cell.add_offspring_to_adult_animals()
+                continue
+            cell.animal_eats(self.year)
+            cell.animals_gives_birth()
+            cell.add_offspring_to_adult_animals()
+            adj_cells = self.adjacent_cells(*divmod(cell_id, self.map_dims[1]))
+            for adj_cell in adj_cells:
+                if adj_cell.cell_id < cell_id:
+                    adj_cell.regrow_fodder(self.year)
+                else:
+                    adj_cell.regrow_fodder(self.year - 1)
+            cell.animal_migrates(adj_cells, self.year)
+            cell.grow_all_animals()
+            cell.animal_dies()
+        self.population.advance_year()
+
+    def feed_and_breed(self):
+        """
+        Starts a new year, animals in the populated cells eat and then
+        give birth
+        """
+        self.year += 1
+        active = self.active_cell_ids()
+        for cell_id in active:
+            self.flat_cells[cell_id].animal_eats(self.year)
+        for cell_id in active:
+            cell = self.flat_cells[cell_id]
+            cell.animals_gives_birth()
+            cell.add_offspring_to_adult_animals()
+        # every cell takes its breeding animals from its own animals after
+        # the first year, also cells which are still empty
+        if self.year == 1:
+            for cell in self.flat_cells[self.migratable]:
+                cell.add_offspring_to_adult_animals()
+
+    def grow_and_die(self):
+        """
+        Ends the year, animals in the populated cells age and die
+        """
+        self.population.advance_year()
+        active = self.active_cell_ids()
+        for cell_id in active:
+            self.flat_cells[cell_id].grow_all_animals()
+        for cell_id in active:
+            self.flat_cells[cell_id].animal_dies()
+
+    def fodder_of_cells(self, cell_ids):
+        """
+        Current fodder of cells, fodder which has not been updated since
+        the cells were last visited is grown back first
+        :param cell_ids: flat indices of the cells
+        :return: array with fodder of each cell
+        """
+        fodder = np.zeros(len(cell_ids))
+        for index, cell_id in enumerate(cell_ids):
+            cell = self.flat_cells[cell_id]
+            cell.regrow_fodder(self.year)
+            fodder[index] = cell.fodder
+        return fodder
+
+    def fodder_grid(self):
+        """
+        Fodder of every cell, cells without fodder have 0
+        :return: array of map shape
+        """
+        cell_ids = np.flatnonzero(self.migratable)
+        fodder = np.zeros(self._cells.size)
+        fodder[cell_ids] = self.fodder_of_cells(cell_ids)
+        return fodder.reshape(self.map_dims)
+
+    def cells_next_to(self, cell_ids):
+        """
+        Cells animals from the given cells can move into
+        :param cell_ids: flat indices of cells
+        :return: sorted array of flat indices of migratable neighbours
+        """
+        neighbours = np.unique(self.neighbours[cell_ids])
+        neighbours = neighbours[neighbours >= 0]
+        return neighbours[self.migratable[neighbours]]
+
+    def census(self):
+        """
+        Number of animals of each species in every cell, copied from the
+        counts kept by the population store
+        :return: array of shape (species, rows, columns), species in the
+        order of Population.species_codes
+        """
+        return self.population.cell_counts.reshape(
+            (len(Population.species_codes),) + self.map_dims).copy()
+
+    def herbivore_weight_and_counts(self):
+        """
+        Total herbivore weight and number of animals of each species in
+        every cell, from the population store
+        :return: array with herbivore weight per cell and dictionary with
+        an array of animal counts per cell for every species
+        """
+        num_cells = self._cells.size
+        living = self.population.rows
+        cell_ids = self.population.cell[living]
+        species_codes = self.population.species[living]
+        herb = species_codes == Population.species_codes['Herbivore']
+        herb_weight = np.bincount(cell_ids[herb],
+                                  weights=self.population.weight[living[herb]],
+                                  minlength=num_cells)
+        counts = {species: self.population.cell_counts[code].copy()
+                  for species, code in Population.species_codes.items()}
+        return herb_weight, counts
+
+    def build_propensity_grids(self, fodder, herb_weight, counts):
+        """
+        Propensity to move into each cell for every species
+        :param fodder: array with fodder of every cell
+        :param herb_weight: array with herbivore weight in every cell
+        :param counts: dictionary with array of animal counts per species
+        :return: dictionary with one array of map shape per species
+        """
+        food = {'Herbivore': fodder, 'Carnivore': herb_weight}
+        grids = {}
+        for species, fauna_class in self.fauna_dict.items():
+            grids[species] = self.kernels.propensity(
+                food[species], counts[species], fauna_class.parameters['F'],
+                fauna_class.parameters['lambda'],
+                self.migratable).reshape(self.map_dims)
+        return grids
+
+    def propensity_grids(self):
+        """
+        Propensity to move into each cell for every species, calculated
+        from the fodder of the cells and the population store
+        Fodder is only read for cells next to populated cells, which are
+        the only cells animals can move into
+        :return: dictionary with one array of map shape per species
+        """
+        fodder = np.zeros(self._cells.size)
+        needed = self.cells_next_to(self.active_cell_ids())
+        fodder[needed] = self.fodder_of_cells(needed)
+        herb_weight, counts = self.herbivore_weight_and_counts()
+        return self.build_propensity_grids(fodder, herb_weight, counts)
+
+    def migrate_animals(self):
+        """
+        All animals on the island migrate at once. Propensity grids are
+        built once, every animal decides to move with probability
+        mu * fitness drawn from the stream of its cell, and the destinations
+        of all movers are sampled at once. Movers are added to their new
+        cell in the order of the cell they came from
+        """
+        grids = self.propensity_grids()
+        for species in self.fauna_dict:
+            self.move_animals(species, *self.draw_moves(species,
+                                                        grids[species]))
+
+    def draw_moves(self, species, grid):
+        """
+        Decides which animals of a species move and where to
+        :param species: 'Herbivore' or 'Carnivore'
+        :param grid: propensity grid of the species
+        :return: row indices of moving animals, flat index of the cell
+        each one leaves and of the cell it moves to
+        """
+        fauna_class = self.fauna_dict[species]
+        probabilities = self.kernels.move_probabilities(grid.ravel(),
+                                                        self.neighbours)
+        can_move = probabilities.any(axis=1)
+        movers, sources, uniforms = [], [], []
+        for cell_id in self.active_cell_ids():
+            if not can_move[cell_id]:
+                continue
+            cell = self.flat_cells[cell_id]
+            rows = cell.fauna_rows[species]
+            if len(rows) == 0:
+                continue
+            moves = cell.rng.random(len(rows)) < \
+                fauna_class.parameters['mu'] * cell.fitness(species)
+            num_movers = int(moves.sum())
+            if num_movers == 0:
+                continue
+            movers.append(rows[moves])
+            sources.append(np.full(num_movers, cell_id))
+            uniforms.append(cell.rng.random(num_movers))
+        if not movers:
+            empty = np.empty(0, dtype=int)
+            return empty, empty, empty
+        movers = np.concatenate(movers)
+        sources = np.concatenate(sources)
+        directions = self.kernels.sample_directions(
+            probabilities[sources], np.concatenate(uniforms))
+        targets = self.neighbours[sources, directions]
+        moving = self.migratable[targets]
+        return movers[moving], sources[moving], targets[moving]
+
+    def move_animals(self, species, movers, sources, targets):
+        """
+        Moves animals from their cells to new cells
+        :param species: 'Herbivore' or 'Carnivore'
+        :param movers: row indices of moving animals
+        :param sources: flat index of cell each animal leaves
+        :param targets: flat index of cell each animal moves to
+        """
+        self.population.cell[movers] = targets
+        self.remove_movers(species, sources)
+        self.settle_movers(species, movers, sources, targets)
+
+    def remove_movers(self, species, sources):
+        """
+        Drops the animals whose cell has changed from the cells they left
+        :param species: 'Herbivore' or 'Carnivore'
+        :param sources: flat index of the cells animals left
+        """
+        for cell_id in np.unique(sources):
+            cell = self.flat_cells[cell_id]
+            rows = cell.fauna_rows[species]
+            cell.set_fauna_rows(species,
+                                rows[self.population.cell[rows] == cell_id])
+
+    def settle_movers(self, species, movers, sources, targets):
+        """
+        Adds movers to their new cells, in the order of the cell they came
+        from and keeping their order within that cell
+        :param species: 'Herbivore' or 'Carnivore'
+        :param movers: row indices of moving animals
+        :param sources: flat index of cell each animal left
+        :param targets: flat index of cell each animal moves to
+        """
+        order = np.lexsort((sources, targets))
+        target_ids, starts = np.unique(targets[order], return_index=True)
+        for cell_id, arrivals in zip(target_ids,
+                                     np.split(movers[order], starts[1:])):
+            self.flat_cells[cell_id].add_rows(species, arrivals)
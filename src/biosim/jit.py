@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Numba compiled versions of the loops in kernels which are hard to write
+with array operations: feeding, predation and sampling of migration
+directions. They take the same arguments as the kernels and use the
+random numbers in the same order, so they give the same results.
+Numba is optional, without it kernels.set_backend keeps the pure Python
+kernels
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+available = numba is not None
+
+
+def compile_kernel(function):
+    """
+    Compiles a function with numba if it is installed
+    :param function: function written for numba's nopython mode
+    :return: compiled function, or function itself without numba
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@compile_kernel
+def _feed_herbivores(fodder, demand):
+    eaten = np.empty(len(demand))
+    eaten_before = 0.0
+    for herb in range(len(demand)):
+        eaten_before += demand[herb]
+        available_food = fodder - (eaten_before - demand[herb])
+        eaten[herb] = min(max(available_food, 0.0), demand[herb])
+    return eaten
+
+
+def feed_herbivores(fodder, demand):
+    """
+    Compiled version of kernels.feed_herbivores
+    """
+    eaten = _feed_herbivores(float(fodder), np.asarray(demand, dtype=float))
+    return eaten, max(fodder - eaten.sum(), 0)
+
+
+@compile_kernel
+def _predation(carn_fitness, herb_fitness, herb_weight, demand,
+               delta_phi_max, uniforms, state, eaten, killed):
+    """
+    Runs the hunt from the carnivore, position and batch size in state
+    until all carnivores have hunted or the uniforms run out. Then state
+    holds where to go on
+    :return: number of uniforms used and number of uniforms needed for
+    the next batch, 0 if the hunt is over
+    """
+    used = 0
+    carn, position, batch = state[0], state[1], state[2]
+    candidates = np.empty(len(herb_fitness), dtype=np.int64)
+    while carn < len(carn_fitness):
+        fitness = carn_fitness[carn]
+        end = np.searchsorted(herb_fitness, fitness)
+        amount = eaten[carn]
+        while position < end and amount < demand:
+            stop = min(position + batch, end)
+            num_candidates = 0
+            for herb in range(position, stop):
+                if not killed[herb]:
+                    candidates[num_candidates] = herb
+                    num_candidates += 1
+            if used + num_candidates > len(uniforms):
+                eaten[carn] = amount
+                state[0], state[1], state[2] = carn, position, batch
+                return used, num_candidates
+            position = stop
+            batch *= 2
+            draws = uniforms[used:used + num_candidates]
+            used += num_candidates
+            for index in range(num_candidates):
+                herb = candidates[index]
+                difference = fitness - herb_fitness[herb]
+                if difference <= 0:
+                    probability = 0.0
+                else:
+                    probability = min(difference / delta_phi_max, 1.0)
+                if not draws[index] < probability:
+                    continue
+                if amount >= demand:
+                    break
+                food_required = demand - amount
+                if food_required < herb_weight[herb]:
+                    amount += herb_weight[herb]
+                elif food_required > herb_weight[herb]:
+                    amount += food_required
+                killed[herb] = True
+        eaten[carn] = amount
+        carn += 1
+        position = 0
+        batch = state[3]
+    state[0], state[1], state[2] = carn, position, batch
+    return used, 0
+
+
+def predation(carn_fitness, herb_fitness, herb_weight, demand, delta_phi_max,
+              rng, batch_size=32):
+    """
+    Compiled version of kernels.predation. The kernel uses the uniforms
+    buffered in the stream, when they run out the stream is asked for
+    the next batch exactly as kernels.predation does, so the generator is
+    called at the same points
+    """
+    carn_fitness = np.asarray(carn_fitness, dtype=float)
+    herb_fitness = np.asarray(herb_fitness, dtype=float)
+    herb_weight = np.asarray(herb_weight, dtype=float)
+    eaten = np.zeros(len(carn_fitness))
+    killed = np.zeros(len(herb_fitness), dtype=bool)
+    state = np.array([0, 0, batch_size, batch_size], dtype=np.int64)
+    uniforms = rng.take_buffered()
+    while True:
+        used, needed = _predation(carn_fitness, herb_fitness, herb_weight,
+                                  float(demand), float(delta_phi_max),
+                                  uniforms, state, eaten, killed)
+        rng.put_back(uniforms[used:])
+        if needed == 0:
+            break
+        uniforms = np.concatenate((rng.random(needed), rng.take_buffered()))
+    return eaten, killed
+
+
+@compile_kernel
+def _sample_directions(probabilities, uniforms):
+    num_movers, num_directions = probabilities.shape
+    directions = np.empty(num_movers, dtype=np.int64)
+    for mover in range(num_movers):
+        offset = float(mover)
+        value = uniforms[mover] + offset
+        cumulative = 0.0
+        position = 0
+        for direction in range(num_directions):
+            cumulative += probabilities[mover, direction]
+            if cumulative + offset <= value:
+                position += 1
+        directions[mover] = min(position, num_directions - 1)
+    return directions
+
+
+def sample_directions(probabilities, uniforms):
+    """
+    Compiled version of kernels.sample_directions
+    """
+    return _sample_directions(np.asarray(probabilities, dtype=float),
+                              np.asarray(uniforms, dtype=float))
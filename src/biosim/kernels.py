@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+Array kernels for the phases of the annual cycle of a cell. The kernels
+work on plain NumPy arrays taken from the Population store, so they can be
+used for one cell or for a batch of cells
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import types
+
+import numpy as np
+
+
+def feed_herbivores(fodder, demand):
+    """
+    Shares the fodder of a cell between herbivores. Herbivores eat in the
+    given order, each one eats its demand F as long as there is fodder
+    left, the first herbivore which can not get its full demand eats the
+    rest of the fodder
+    :param fodder: fodder available in the cell
+    :param demand: array with food demand of each herbivore in eating order
+    :return: array with fodder eaten by each herbivore and fodder left
+    """
+    demand = np.asarray(demand, dtype=float)
+    eaten_before = np.cumsum(demand) - demand
+    eaten = np.clip(fodder - eaten_before, 0, demand)
+    return eaten, max(fodder - eaten.sum(), 0)
+
+
+def kill_probability(carn_fitness, herb_fitness, delta_phi_max):
+    """
+    Probability with which a carnivore kills herbivores, array version of
+    Carnivore.probability_of_kill
+    :param carn_fitness: fitness of the carnivore
+    :param herb_fitness: array with fitness of herbivores
+    :param delta_phi_max: parameter DeltaPhiMax of carnivores
+    """
+    difference = carn_fitness - np.asarray(herb_fitness)
+    return np.where(difference <= 0, 0.0,
+                    np.minimum(difference / delta_phi_max, 1.0))
+
+
+def predation(carn_fitness, herb_fitness, herb_weight, demand, delta_phi_max,
+              rng, batch_size=32):
+    """
+    Carnivores hunt one after another in the given order. Each carnivore
+    tries to kill the herbivores which are still alive in order of
+    increasing fitness until it has eaten its demand F.
+    Only herbivores with lower fitness than the carnivore can be killed,
+    so a carnivore stops at the first herbivore which is as fit as itself.
+    Kill decisions are drawn in batches of growing size, killed herbivores
+    are only marked in a mask
+    :param carn_fitness: array with fitness of carnivores in hunting order
+    :param herb_fitness: array with fitness of herbivores, increasing
+    :param herb_weight: array with weight of herbivores
+    :param demand: food demand F of carnivores
+    :param delta_phi_max: parameter DeltaPhiMax of carnivores
+    :param rng: RandomStream for the kill decisions
+    :param batch_size: number of kill decisions drawn in first batch
+    :return: array with food eaten by each carnivore, boolean array
+    marking killed herbivores
+    """
+    eaten = np.zeros(len(carn_fitness))
+    killed = np.zeros(len(herb_fitness), dtype=bool)
+    for carn, fitness in enumerate(carn_fitness):
+        end = np.searchsorted(herb_fitness, fitness)
+        position = 0
+        batch = batch_size
+        amount = 0.0
+        while position < end and amount < demand:
+            stop = min(position + batch, end)
+            candidates = np.flatnonzero(~killed[position:stop]) + position
+            position = stop
+            batch *= 2
+            if len(candidates) == 0:
+                continue
+            kills = candidates[rng.random(len(candidates)) < kill_probability(
+                fitness, herb_fitness[candidates], delta_phi_max)]
+            for herb in kills:
+                if amount >= demand:
+                    break
+                food_required = demand - amount
+                if food_required < herb_weight[herb]:
+                    amount += herb_weight[herb]
+                elif food_required > herb_weight[herb]:
+                    amount += food_required
+                killed[herb] = True
+        eaten[carn] = amount
+    return eaten, killed
+
+
+def deaths(fitness, omega, rng):
+    """
+    Decides which animals die, an animal dies with probability
+    omega * (1 - fitness). As in Fauna.probability_of_death animals with
+    fitness 0 are not drawn for
+    :param fitness: array with fitness of animals
+    :param omega: death parameter of the species
+    :param rng: RandomStream for the decisions
+    :return: boolean array marking animals which die
+    """
+    fitness = np.asarray(fitness)
+    return (fitness != 0) & (rng.random(len(fitness)) < omega * (1 - fitness))
+
+
+def births(fitness, weight, num_animals, parameters, rng):
+    """
+    Decides which animals give birth and draws the weight of all newborns
+    in one sample. An animal can give birth if there are atleast two
+    animals of the species in the cell and it weighs atleast
+    zeta * (w_birth + sigma_birth), it then gives birth with probability
+    min(1, gamma * fitness * (N - 1)). The mother loses xi times the weight
+    of the newborn if she is heavier than that
+    :param fitness: array with fitness of animals
+    :param weight: array with weight of animals
+    :param num_animals: number of animals N of the species in the cell
+    :param parameters: parameters of the species
+    :param rng: RandomStream for the decisions and newborn weights
+    :return: boolean array marking animals giving birth, array with weight
+    of the newborns and array with weight lost by their mothers
+    """
+    fitness = np.asarray(fitness)
+    weight = np.asarray(weight)
+    if num_animals < 2:
+        return np.zeros(len(fitness), dtype=bool), np.empty(0), np.empty(0)
+    eligible = weight >= parameters['zeta'] * (parameters['w_birth'] +
+                                               parameters['sigma_birth'])
+    probability = np.minimum(1, parameters['gamma'] * fitness *
+                             (num_animals - 1))
+    gives_birth = eligible & (rng.random(len(fitness)) < probability)
+    newborn_weight = rng.normal(parameters['w_birth'],
+                                parameters['sigma_birth'],
+                                size=int(gives_birth.sum()))
+    weight_loss = parameters['xi'] * newborn_weight
+    weight_loss[weight[gives_birth] <= weight_loss] = 0
+    return gives_birth, newborn_weight, weight_loss
+
+
+def propensity(food, num_animals, demand, lambda_, migratable):
+    """
+    Propensity of a species to move into cells, exp(lambda * E) with the
+    relative abundance of fodder E = f / ((n + 1) * F). Cells animals can
+    not move into have propensity 0
+    :param food: array with relevant food f of the species in each cell
+    :param num_animals: array with number of animals n of the species
+    :param demand: food demand F of the species
+    :param lambda_: parameter lambda of the species
+    :param migratable: boolean array marking cells animals can move into
+    :return: array with propensity of each cell
+    """
+    abundance = food / ((num_animals + 1) * demand)
+    return np.where(migratable, np.exp(lambda_ * abundance), 0.0)
+
+
+def move_probabilities(propensity, neighbours):
+    """
+    Probability to move from every cell to each of its neighbours
+    :param propensity: array with propensity of every cell
+    :param neighbours: array of shape (number of cells, 4) with index of
+    the neighbour cells, -1 where there is no neighbour
+    :return: array of shape (number of cells, 4), rows of cells with no
+    neighbour to move to are 0
+    """
+    propensity = np.append(propensity, 0.0)
+    neighbour_propensity = propensity[neighbours]
+    total = neighbour_propensity.sum(axis=1, keepdims=True)
+    return np.divide(neighbour_propensity, total,
+                     out=np.zeros_like(neighbour_propensity),
+                     where=total > 0)
+
+
+def sample_directions(probabilities, uniforms):
+    """
+    Samples one direction for each mover with one searchsorted over the
+    cumulative probabilities of all movers, every row is shifted by its
+    index so the rows stay sorted when flattened
+    :param probabilities: array of shape (number of movers, directions)
+    :param uniforms: array with one uniform random number for each mover
+    :return: array with index of direction of each mover
+    """
+    num_movers, num_directions = probabilities.shape
+    offset = np.arange(num_movers)
+    cumulative = np.cumsum(probabilities, axis=1) + offset[:, np.newaxis]
+    position = np.searchsorted(cumulative.ravel(), uniforms + offset,
+                               side='right')
+    return np.minimum(position - num_directions * offset, num_directions - 1)
+
+
+backends = ('python', 'numba')
+python_kernels = {'feed_herbivores': feed_herbivores,
+                  'predation': predation,
+                  'deaths': deaths,
+                  'births': births,
+                  'propensity': propensity,
+                  'move_probabilities': move_probabilities,
+                  'sample_directions': sample_directions}
+compiled_kernels = ('feed_herbivores', 'predation', 'sample_directions')
+
+
+def kernel_set(backend):
+    """
+    Kernels used by the cells and the island. 'numba' uses the compiled
+    kernels of biosim.jit for the kernels in compiled_kernels, the loops
+    which can not be written as array operations, and falls back to
+    'python' if numba is not installed.
+    Every island can hold its own set, so islands with different backends
+    can run side by side
+    :param backend: 'python' or 'numba'
+    :return: name of the backend in use and namespace with a function for
+    every name in python_kernels
+    """
+    if backend not in backends:
+        raise ValueError('Unknown kernel backend ' + str(backend))
+    kernels = dict(python_kernels)
+    if backend == 'numba':
+        from biosim import jit
+        if jit.available:
+            kernels.update({name: getattr(jit, name)
+                            for name in compiled_kernels})
+        else:
+            backend = 'python'
+    return backend, types.SimpleNamespace(**kernels)
+
+
+default_backend, default_kernels = kernel_set('python')
+
+
+def set_backend(backend):
+    """
+    Selects default_kernels, the kernels of cells and islands created
+    without a backend of their own, see kernel_set. The functions of this
+    module are not changed
+    :param backend: 'python' or 'numba'
+    :return: name of the backend in use
+    """
+    global default_backend, default_kernels
+    default_backend, default_kernels = kernel_set(backend)
+    return default_backend
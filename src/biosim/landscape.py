@@ -10,24 +10,77 @@ __email__ = "hesa@nmbu.no & misi@nmbu.no"
 
 
 import math
-import operator
 import numpy as np
 
+from biosim import kernels
+from biosim.fauna import Herbivore, Carnivore
+from biosim.population import Population
+from biosim.randomness import RandomStream
+
 
 class Landscape:
     """
     Parent class for type of landscapes Jungle, Savannah,
     Mountain, Desert, Ocean
+    Animals in the cell are kept as arrays of row indices into a
+    Population store, one array per species
+    All random decisions in the cell are drawn from the RandomStream rng
     """
     parameters = {}
+    fauna_classes = {'Herbivore': Herbivore, 'Carnivore': Carnivore}
 
-    def __init__(self):
+    def __init__(self, population=None):
         """
+        :param population: Population store the animals of the cell live
+        in, Island passes its store and sets cell_id. Cells created on
+        their own get a store of their own
         """
         self.sorted_animal_fitness = {}
-        self.fauna_list = {'Herbivore': [], 'Carnivore': []}
-        self.new_fauna_list = {'Herbivore': [], 'Carnivore': []}
+        if population is None:
+            population = Population()
+        self.population = population
+        self.cell_id = -1
+        self.rng = RandomStream()
+        self.kernels = kernels.default_kernels
+        self.fauna_rows = {'Herbivore': np.empty(0, dtype=int),
+                           'Carnivore': np.empty(0, dtype=int)}
+        self.new_fauna_rows = {'Herbivore': np.empty(0, dtype=int),
+                               'Carnivore': np.empty(0, dtype=int)}
         self._remaining_food = {'Herbivore': 0, 'Carnivore': 0}
+        self.fodder_year = 0
+        self._derived = {}
+        self._derived_stamp = None
+
+    @property
+    def fauna_list(self):
+        """
+        Animal objects of the cell as dictionary of lists per species
+        The objects are views, changing them changes the store
+        """
+        return {species: self.animals(species) for species in self.fauna_rows}
+
+    def animals(self, species, rows=None):
+        """
+        Creates animal objects for rows of the store
+        :param species: 'Herbivore' or 'Carnivore'
+        :param rows: row indices, default is all animals of species in cell
+        :return: list of animal objects
+        """
+        if rows is None:
+            rows = self.fauna_rows[species]
+        fauna_class = self.fauna_classes[species]
+        return [fauna_class.view(self.population, row) for row in rows]
+
+    def fitness(self, species, rows=None):
+        """
+        Fitness of animals of one species as array
+        :param species: 'Herbivore' or 'Carnivore'
+        :param rows: row indices, default is all animals of species in cell
+        """
+        if rows is None:
+            rows = self.fauna_rows[species]
+        return self.fauna_classes[species].cached_fitness(self.population,
+                                                          rows)
 
     def save_fitness(self, animals, species):
         """
@@ -40,13 +93,40 @@ class Landscape:
 
     def order_by_fitness(self):
         """
-        Sorts animal_objects according to the fitness
+        Sorts animals according to the fitness, herbivores in increasing
+        and carnivores in decreasing order
+        """
+        herb_rows = self.fauna_rows['Herbivore']
+        carn_rows = self.fauna_rows['Carnivore']
+        self.fauna_rows['Herbivore'] = herb_rows[
+            np.argsort(self.fitness('Herbivore'), kind='stable')]
+        self.fauna_rows['Carnivore'] = carn_rows[
+            np.argsort(-self.fitness('Carnivore'), kind='stable')]
+
+    def derived(self, key, compute):
+        """
+        Value derived from the animals and the fodder of the cell, it is
+        computed once and kept until invalidate_derived is called, the
+        fodder changes or the population store moves to another year
+        :param key: name of the value
+        :param compute: function without arguments computing the value
+        :return: the value
         """
-        self.fauna_list['Herbivore'].sort(key=operator.
-                                          attrgetter('animal_fitness'))
-        self.fauna_list['Carnivore'].sort(key=operator.
-                                          attrgetter('animal_fitness'),
-                                          reverse=True)
+        stamp = (self.population.year, self.population.revision,
+                 self.fodder)
+        if stamp != self._derived_stamp:
+            self._derived = {}
+            self._derived_stamp = stamp
+        if key not in self._derived:
+            self._derived[key] = compute()
+        return self._derived[key]
+
+    def invalidate_derived(self):
+        """
+        Drops the derived values, called when animals are added to or
+        removed from the cell or their weights change
+        """
+        self._derived = {}
 
     def relevant_food(self, animal):
         """
@@ -59,16 +139,54 @@ class Landscape:
     def add_animal(self, animal):
         """
         Adds animal(object) to the species list of cell
+        An animal from another store is copied into the store of the cell
         """
         species = animal.__class__.__name__
-        self.fauna_list[species].append(animal)
+        if animal.population is not self.population:
+            animal.row = self.population.add(species, animal.age,
+                                             animal.weight)
+            animal.population = self.population
+        self.population.cell[animal.row] = self.cell_id
+        self.set_fauna_rows(species, np.append(self.fauna_rows[species],
+                                               animal.row))
+
+    def add_rows(self, species, rows):
+        """
+        Adds animals which are already in the store of the cell
+        :param species: 'Herbivore' or 'Carnivore'
+        :param rows: row indices of the animals
+        """
+        self.population.cell[rows] = self.cell_id
+        self.set_fauna_rows(species, np.concatenate((self.fauna_rows[species],
+                                                     rows)))
+
+    def set_fauna_rows(self, species, rows):
+        """
+        Replaces the animals of a species in the cell and keeps the set of
+        populated cells and the animal counts of the population store up
+        to date
+        :param species: 'Herbivore' or 'Carnivore'
+        :param rows: row indices of the animals
+        """
+        change = len(rows) - len(self.fauna_rows[species])
+        self.fauna_rows[species] = rows
+        self.invalidate_derived()
+        if self.cell_id < 0:
+            return
+        if change:
+            self.population.update_counts(species, self.cell_id, change)
+        if len(rows) > 0:
+            self.population.active_cells.add(self.cell_id)
+        elif not any(len(rows) for rows in self.fauna_rows.values()):
+            self.population.active_cells.discard(self.cell_id)
 
     def remove_animal(self, animal):
         """
         Removes animal(object) from list of same species for cell
         """
         species = animal.__class__.__name__
-        self.fauna_list[species].remove(animal)
+        rows = self.fauna_rows[species]
+        self.set_fauna_rows(species, rows[rows != animal.row])
 
     def relative_abundance_fodder(self, animal):
         """
@@ -76,8 +194,10 @@ class Landscape:
         number of animals of same species and the F
         """
         species = animal.__class__.__name__
-        return self.relevant_food(animal) / (
-                (len(self.fauna_list[species]) + 1) * animal.parameters['F'])
+        return self.derived(
+            ('abundance', species, animal.parameter_version),
+            lambda: self.relevant_food(animal) / (
+                (len(self.fauna_rows[species]) + 1) * animal.parameters['F']))
 
     def propensity_to_move(self, animal):
         """
@@ -87,8 +207,11 @@ class Landscape:
         if isinstance(self, Mountain) or isinstance(self, Ocean):
             return 0
         else:
-            return math.exp(animal.parameters['lambda'] *
-                            self.relative_abundance_fodder(animal))
+            species = animal.__class__.__name__
+            return self.derived(
+                ('propensity', species, animal.parameter_version),
+                lambda: math.exp(animal.parameters['lambda'] *
+                                 self.relative_abundance_fodder(animal)))
 
     def probability_move_to_cell(self, animal, total_propensity):
         """
@@ -96,37 +219,42 @@ class Landscape:
         """
         return self.propensity_to_move(animal) / total_propensity
 
-    def animal_eats(self):
+    def animal_eats(self, year=None):
         """
         Feeding the animals in the cell in the order
         Grow the fodder, Herbivore eat fodder, Carnivore eats Herbivore
+        :param year: number of the current year counted from 1, when given
+        the fodder also grows back for the years the cell was not visited
         """
-        self.update_fodder()
+        if year is None:
+            self.update_fodder()
+        else:
+            self.regrow_fodder(year)
         self.herbivore_eats()
         self.carnivore_eats()
 
     def herbivore_eats(self):
         """
-        Herbivores eat according to their fitness. Animal with
-        highest fitness eats first
+        Herbivores eat in the order of order_by_fitness
         If there is no fodder available in cell animal doesnt eat
         if the available fodder is greater than the food
         required animal eats the required amount. We calculate the
         remaining fodder in cell
         if fodder available is less than food required animal eates
         available food. And update remaining fodder as 0
+        The intake of all herbivores is found in one pass from the
+        cumulative sum of their demand
         """
         self.order_by_fitness()
-        for herb in self.fauna_list['Herbivore']:
-            herb_remaining_fodder = self.remaining_food['Herbivore']
-            if herb_remaining_fodder == 0:
-                break
-            elif herb_remaining_fodder >= herb.parameters['F']:
-                herb.animal_eats(herb.parameters['F'])
-                self.remaining_food['Herbivore'] -= herb.parameters['F']
-            elif 0 < herb_remaining_fodder < herb.parameters['F']:
-                herb.animal_eats(herb_remaining_fodder)
-                self.remaining_food['Herbivore'] = 0
+        rows = self.fauna_rows['Herbivore']
+        if len(rows) == 0:
+            return
+        params = Herbivore.parameters
+        eaten, self.remaining_food['Herbivore'] = self.kernels.feed_herbivores(
+            self.remaining_food['Herbivore'], np.full(len(rows), params['F']))
+        self.population.weight[rows] += params['beta'] * eaten
+        self.population.fitness[rows] = np.nan
+        self.invalidate_derived()
 
     def carnivore_eats(self):
         """
@@ -134,56 +262,76 @@ class Landscape:
         fitness will be eaten first.
         if there is enough weight for carnivore to eat it eats the
         required food F, Else it eats food equal to weight of herbivores
+        Herbivore fitness is calculated once for the whole cell and the
+        kill decisions are drawn in batches by kernels.predation
         """
         self.order_by_fitness()
-        for carn in self.fauna_list['Carnivore']:
-            food_required = carn.parameters['F']
-            amount_to_eat = 0
-            not_eaten_animals = []
-            for i, herb in enumerate(self.fauna_list['Herbivore']):
-                if food_required <= amount_to_eat:
-                    not_eaten_animals.extend(self.fauna_list['Herbivore'][i:])
-                    break
-                elif np.random.random() < carn.probability_of_kill(herb):
-                    if food_required - amount_to_eat < herb.weight:
-                        amount_to_eat += herb.weight
-                    elif food_required - amount_to_eat > herb.weight:
-                        amount_to_eat += food_required - amount_to_eat
-                else:
-                    not_eaten_animals.append(herb)
-            carn.animal_eats(amount_to_eat)
-            self.fauna_list['Herbivore'] = not_eaten_animals
-
-    def update_fodder(self):
+        herb_rows = self.fauna_rows['Herbivore']
+        carn_rows = self.fauna_rows['Carnivore']
+        if len(herb_rows) == 0 or len(carn_rows) == 0:
+            return
+        params = Carnivore.parameters
+        eaten, killed = self.kernels.predation(
+            self.fitness('Carnivore'), self.fitness('Herbivore'),
+            self.population.weight[herb_rows], params['F'],
+            params['DeltaPhiMax'], self.rng)
+        self.population.weight[carn_rows] += params['beta'] * eaten
+        self.population.fitness[carn_rows] = np.nan
+        self.population.kill(herb_rows[killed])
+        self.set_fauna_rows('Herbivore', herb_rows[~killed])
+
+    def update_fodder(self, num_years=1):
         """
         Method to update fodder in cells. Overridden in Jungle and Savannah
+        :param num_years: number of years of growth
         """
         pass
 
+    def regrow_fodder(self, year):
+        """
+        Brings the fodder up to date. The fodder of a cell is only updated
+        when it is needed, it then grows for all years since the last
+        update in one step
+        :param year: number of the current year counted from 1
+        """
+        num_years = year - self.fodder_year
+        if num_years > 0:
+            self.update_fodder(num_years)
+            self.fodder_year = year
+
     def update_animal_weight_age(self):
         """
         Each year animal increases in age by 1 and loses weight by factor eta
         """
-        for species in self.fauna_list:
-            for animal in self.fauna_list[species]:
-                animal.animal_grows()
+        self.grow_all_animals()
 
     def animals_gives_birth(self):
         """
         Compare the probability_of_birth with random value generated
         If its greater animal gives birth. Create offspring of same species
         and decrease weight of animal
-        """
-        for species, animals in self.new_fauna_list.items():
-            for i in range(math.floor(len(self.new_fauna_list[species])/2)):
-                animal = animals[i]
-                if animal.probability_of_birth(len(animals)):
-                    offspring_species = animal.__class__
-                    offspring = offspring_species()
-                    animal.update_weight_after_birth(offspring)
-                    if animal.gives_birth:
-                        self.fauna_list[species].append(offspring)
-                        animal.gives_birth = False
+        Birth is decided for the first half of the animals of each species
+        at once, the number of animals at the start of the breeding season
+        is used for all of them. Newborns are added to the store in bulk
+        """
+        for species, rows in self.new_fauna_rows.items():
+            num_animals = len(rows)
+            candidates = rows[:num_animals // 2]
+            if len(candidates) == 0:
+                continue
+            gives_birth, newborn_weight, weight_loss = self.kernels.births(
+                self.fitness(species, candidates),
+                self.population.weight[candidates], num_animals,
+                self.fauna_classes[species].parameters, self.rng)
+            if len(newborn_weight) == 0:
+                continue
+            mothers = candidates[gives_birth]
+            self.population.weight[mothers] -= weight_loss
+            self.population.fitness[mothers] = np.nan
+            newborns = self.population.add_many(
+                species, np.zeros(len(newborn_weight), dtype=int),
+                newborn_weight)
+            self.add_rows(species, newborns)
 
     def add_offspring_to_adult_animals(self):
         """
@@ -192,28 +340,44 @@ class Landscape:
         adult_fauna as input to calculate the giving birth probability.
         """
 
-        self.new_fauna_list = self.fauna_list
+        self.new_fauna_rows = self.fauna_rows
 
     def animal_dies(self):
         """
         If generated random number is greater than probability_of_death
         We remove the animal from dictionary
+        Death is decided for all animals of a species at once and the
+        survivors are kept with a boolean mask
         """
-        for species, animals in self.fauna_list.items():
-            for animal in animals:
-                if animal.probability_of_death:
-                    self.remove_animal(animal)
+        for species, rows in self.fauna_rows.items():
+            if len(rows) == 0:
+                continue
+            dies = self.kernels.deaths(
+                self.fitness(species),
+                self.fauna_classes[species].parameters['omega'], self.rng)
+            self.population.kill(rows[dies])
+            self.set_fauna_rows(species, rows[~dies])
 
-    def animal_migrates(self, adj_cells):
+    def animal_migrates(self, adj_cells, year=None):
         """
         We calculate the probability as propensity/sum of propensity
         for each adj cells. Animal migrates to the cell with highest
         probability to move. We add the animal to the newly moved cell and
         remove it from old cell.
-        """
-        for species, animals in self.fauna_list.items():
-            for animal in animals:
-                if animal.probability_of_move:
+        The moves of all animals of a species are collected first and then
+        applied at once, movers are appended to their new cells and the
+        cell keeps the rest of its animals
+        :param adj_cells: list with the 4 adjacent cells
+        :param year: year of the simulation, animals which already moved
+        this year stay where they are and the movers are marked in the
+        moved_year column of the store. None moves all animals
+        :return: array with row indices of the animals which moved
+        """
+        moved = [np.empty(0, dtype=int)]
+        for species, rows in self.fauna_rows.items():
+            targets = np.full(len(rows), -1)
+            for index, animal in enumerate(self.animals(species, rows)):
+                if self.rng.random() < animal.move_probability:
                     propensity = [cell.propensity_to_move(animal)
                                   for cell in adj_cells]
                     total_propensity = sum(propensity)
@@ -223,38 +387,61 @@ class Landscape:
                             for cell in adj_cells]
                         cum_probability = np.cumsum(probability)
                         i = 0
-                        while np.random.random() > cum_probability[i]:
+                        while self.rng.random() > cum_probability[i] and \
+                                i < len(adj_cells) - 1:
                             i += 1
-                        cell_to_migrate = adj_cells[i]
-                        if cell_to_migrate.is_migratable:
-                            if animal.is_animal_moved_already is False:
-                                cell_to_migrate.add_animal(animal)
-                                self.remove_animal(animal)
-                                animal.is_animal_moved_already = True
+                        if adj_cells[i].is_migratable:
+                            targets[index] = i
+            if year is not None:
+                targets[self.population.moved_year[rows] == year] = -1
+            if not (targets >= 0).any():
+                continue
+            if year is not None:
+                self.population.moved_year[rows[targets >= 0]] = year
+            for i, cell in enumerate(adj_cells):
+                arrivals = rows[targets == i]
+                if len(arrivals) > 0:
+                    cell.add_rows(species, arrivals)
+            self.set_fauna_rows(species, rows[targets < 0])
+            moved.append(rows[targets >= 0])
+        return np.concatenate(moved)
 
     def grow_all_animals(self):
         """
-        Growing all animals
+        Growing all animals, age increases by one and weight decreases
+        by a factor of eta
         """
-        for species in self.fauna_list:
-            for animal in self.fauna_list[species]:
-                animal.animal_grows()
+        for species, rows in self.fauna_rows.items():
+            eta = self.fauna_classes[species].parameters['eta']
+            self.population.age[rows] += 1
+            self.population.weight[rows] -= eta * self.population.weight[rows]
+            self.population.fitness[rows] = np.nan
+        self.invalidate_derived()
 
     @property
     def cell_fauna_count(self):
         """
         Returns count of fauna type as dictionary
         """
-        herb_count = len(self.fauna_list['Herbivore'])
-        carn_count = len(self.fauna_list['Carnivore'])
+        herb_count = len(self.fauna_rows['Herbivore'])
+        carn_count = len(self.fauna_rows['Carnivore'])
         return {'Herbivore': herb_count, 'Carnivore': carn_count}
 
+    @property
+    def fodder(self):
+        """
+        Returns fodder left for herbivores in the cell
+        """
+        return self._remaining_food['Herbivore']
+
     @property
     def total_herb_weight(self):
         """
         Returns the total herbivore weight
         """
-        return sum(herb.weight for herb in self.fauna_list['Herbivore'])
+        def total():
+            return self.population.weight[self.fauna_rows['Herbivore']].sum()
+        return self.derived('total_herb_weight', total)
 
     @property
     def remaining_food(self):
@@ -264,19 +451,10 @@ class Landscape:
         if isinstance(self, (Ocean, Mountain)):
             raise ValueError('There are no fodder available in this cell')
         elif isinstance(self, Desert):
-            self._remaining_food = {'Herbivore': 0,
-                                    'Carnivore': self.total_herb_weight}
-        else:
-            self._remaining_food = {
-                'Herbivore': self._remaining_food['Herbivore'],
-                'Carnivore': self.total_herb_weight}
+            self._remaining_food['Herbivore'] = 0
+        self._remaining_food['Carnivore'] = self.total_herb_weight
         return self._remaining_food
 
-    def reset_migration_flag(self):
-        for species, animals in self.fauna_list.items():
-            for animal in animals:
-                animal.is_animal_moved_already = False
-
 
 class Jungle(Landscape):
     """
@@ -287,15 +465,14 @@ class Jungle(Landscape):
     is_migratable = True
     parameters = {'f_max': 800.0}
 
-    def __init__(self, given_params=None):
+    def __init__(self, given_params=None, population=None):
         # child class of Landscape
-        super().__init__()
+        super().__init__(population)
         if given_params is not None:
             self.set_parameters(given_params)
         self.parameters = Jungle.parameters
-        self.remaining_food['Herbivore'] = self.parameters['f_max']
-        self.remaining_food['Carnivore'] = sum(herb.weight for herb in
-                                               self.fauna_list['Herbivore'])
+        # a new cell holds no animals, so there is no food for carnivores
+        self._remaining_food['Herbivore'] = self.parameters['f_max']
 
     @staticmethod
     def set_parameters(given_params):
@@ -306,10 +483,11 @@ class Jungle(Landscape):
             else:
                 raise ValueError('Parameter not in list' + str(param))
 
-    def update_fodder(self):
+    def update_fodder(self, num_years=1):
         """
         Updates the annual fodder. There is no overgrazing in Jungle so amount
         of available fodder will be equal to f_max
+        :param num_years: number of years of growth
         """
         self.remaining_food['Herbivore'] = self.parameters['f_max']
 
@@ -323,14 +501,13 @@ class Savannah(Landscape):
     is_migratable = True
     parameters = {'f_max': 300.0, 'alpha': 0.3}
 
-    def __init__(self, given_params=None):
-        super().__init__()
+    def __init__(self, given_params=None, population=None):
+        super().__init__(population)
         if given_params is not None:
             self.set_parameters(given_params)
         self.parameters = Savannah.parameters
-        self.remaining_food['Herbivore'] = self.parameters['f_max']
-        self.remaining_food['Carnivore'] = sum(herb.weight for herb in
-                                               self.fauna_list['Herbivore'])
+        # a new cell holds no animals, so there is no food for carnivores
+        self._remaining_food['Herbivore'] = self.parameters['f_max']
 
     @staticmethod
     def set_parameters(given_params):
@@ -341,14 +518,18 @@ class Savannah(Landscape):
             else:
                 raise ValueError('Parameter not in list' + str(param))
 
-    def update_fodder(self):
+    def update_fodder(self, num_years=1):
         """
         Updates the fodder available in Savannah cells. Available fodder is
         calculated by formula  available fodder = available fodder +
         alpha(f_max - available fodder)
+        Growth over n years is f_max - (f_max - fodder)(1 - alpha)^n
+        :param num_years: number of years of growth
         """
-        self.remaining_food['Herbivore'] += self.parameters['alpha'] * (
-                self.parameters['f_max'] - self.remaining_food['Herbivore'])
+        f_max = self.parameters['f_max']
+        fodder = self.fodder
+        self.remaining_food['Herbivore'] = f_max - (f_max - fodder) * (
+                1 - self.parameters['alpha']) ** num_years
 
 
 class Desert(Landscape):
@@ -359,13 +540,12 @@ class Desert(Landscape):
     is_migratable = True
     remaining_food = {'Herbivore': 0}
 
-    def __init__(self):
+    def __init__(self, population=None):
         # child class of Landscape
-        super().__init__()
+        super().__init__(population)
         self.f_max = 0
         self.remaining_food['Herbivore'] = Desert.remaining_food['Herbivore']
-        self.remaining_food['Carnivore'] = sum(herb.weight for herb in
-                                               self.fauna_list['Herbivore'])
+        self.remaining_food['Carnivore'] = 0
 
 
 class Mountain(Landscape):
@@ -377,9 +557,9 @@ class Mountain(Landscape):
     remaining_food = {'Herbivore': 0, 'Carnivore': 0}
     animals_list = {'Herbivore': [], 'Carnivore': []}
 
-    def __init__(self):
+    def __init__(self, population=None):
         # child class of Landscape
-        super().__init__()
+        super().__init__(population)
         self.remaining_food['Herbivore'] = Mountain.remaining_food['Herbivore']
         self.remaining_food['Carnivore'] = Mountain.remaining_food['Carnivore']
         self.animals_list['Herbivore'] = Mountain.animals_list['Herbivore']
@@ -395,9 +575,9 @@ class Ocean(Landscape):
     remaining_food = {'Herbivore': 0, 'Carnivore': 0}
     animals_list = {'Herbivore': [], 'Carnivore': []}
 
-    def __init__(self):
+    def __init__(self, population=None):
         # child class of Landscape
-        super().__init__()
+        super().__init__(population)
         self.remaining_food['Herbivore'] = Ocean.remaining_food['Herbivore']
         self.remaining_food['Carnivore'] = Ocean.remaining_food['Carnivore']
         self.animals_list['Herbivore'] = Ocean.animals_list['Herbivore']
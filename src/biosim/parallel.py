@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parallel island which splits the map into strips of rows, every strip is
+simulated by its own worker process. Eating, birth, ageing and death run
+in the workers, only animals which cross the border of a strip during
+migration are sent between processes.
+All workers hold a copy of the same seeded island, so every cell draws
+from the same random stream as in Island and the results are the same as
+for a serial run with the same seed.
+Cells can be handed between workers while the simulation runs, so that
+every worker gets about the same amount of work on maps where a few
+cells hold most of the animals
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import multiprocessing
+import numpy as np
+
+from biosim.fauna import Herbivore, Carnivore
+from biosim.island import Island
+from biosim.landscape import Savannah, Jungle
+from biosim.population import Population
+
+parameter_classes = (Herbivore, Carnivore, Savannah, Jungle)
+
+
+def current_parameters():
+    """
+    :return: dictionary with a copy of the parameters of every class in
+    parameter_classes, by class name
+    """
+    return {parameter_class.__name__: dict(parameter_class.parameters)
+            for parameter_class in parameter_classes}
+
+
+def strip_owners(map_dims, num_workers):
+    """
+    Splits the rows of the map into contiguous strips
+    :param map_dims: number of rows and columns of the map
+    :param num_workers: number of strips
+    :return: array with the worker owning each cell, by flat index
+    """
+    rows, cols = map_dims
+    owners = np.empty(rows, dtype=int)
+    for worker, strip in enumerate(np.array_split(np.arange(rows),
+                                                  num_workers)):
+        owners[strip] = worker
+    return np.repeat(owners, cols)
+
+
+def cell_costs(counts):
+    """
+    Estimated work for every cell in one year. Every animal eats, ages and
+    may die, and every carnivore hunts among the herbivores of its cell
+    :param counts: dictionary with array of animal counts per species
+    :return: array with cost of each cell
+    """
+    herbs = counts['Herbivore']
+    carns = counts['Carnivore']
+    return 1 + herbs + carns + herbs * carns
+
+
+def balanced_owners(costs, num_workers):
+    """
+    Splits the cells, in order of their flat index, into contiguous runs
+    of about the same total cost
+    :param costs: array with cost of each cell
+    :param num_workers: number of runs
+    :return: array with the worker owning each cell
+    """
+    cumulative = np.cumsum(costs, dtype=float)
+    bounds = cumulative[-1] * np.arange(1, num_workers) / num_workers
+    return np.searchsorted(bounds, cumulative - costs / 2, side='right')
+
+
+class IslandWorker:
+    """
+    Runs the cells owned by one worker. The worker keeps a complete Island,
+    but only the owned cells ever hold animals
+    """
+    columns = ('age', 'weight', 'fitness')
+
+    def __init__(self, island_map, seed, kernel_backend, owners, worker):
+        """
+        :param island_map: Multi-line string specifying island geography
+        :param seed: seed of the island
+        :param kernel_backend: kernels of the island, see Island
+        :param owners: array with the worker owning each cell
+        :param worker: number of this worker
+        """
+        self.island = Island(island_map, seed=seed,
+                             kernel_backend=kernel_backend)
+        self.owners = owners
+        self.owned = owners == worker
+        self.pending = {}
+
+    def add_animals(self, pop):
+        self.island.add_animals(pop)
+
+    def set_parameters(self, parameters):
+        """
+        Takes over the parameters of the main process. The dictionaries are
+        updated in place, cells keep a reference to the landscape ones
+        :param parameters: dictionary from current_parameters
+        """
+        for parameter_class in parameter_classes:
+            parameter_class.parameters.update(
+                parameters[parameter_class.__name__])
+            if parameter_class in (Herbivore, Carnivore):
+                parameter_class.parameter_version += 1
+
+    def feed_and_breed(self):
+        """
+        Eating and birth in the owned cells
+        :return: populated cells, herbivore weight and animal counts
+        """
+        self.island.feed_and_breed()
+        herb_weight, counts = self.island.herbivore_weight_and_counts()
+        return self.island.active_cell_ids(), herb_weight, counts
+
+    def fodder_of_cells(self, cell_ids):
+        return self.island.fodder_of_cells(cell_ids)
+
+    def migrate(self, grids):
+        """
+        Draws the moves of all animals in the owned cells. Animals staying
+        in the strip are kept until settle, animals leaving it are removed
+        :param grids: propensity grids of the whole island
+        :return: dictionary with the animals leaving the strip per species
+        """
+        population = self.island.population
+        emigrants = {}
+        for species in self.island.fauna_dict:
+            movers, sources, targets = self.island.draw_moves(
+                species, grids[species])
+            population.cell[movers] = targets
+            self.island.remove_movers(species, sources)
+            leaving = ~self.owned[targets]
+            rows = movers[leaving]
+            emigrants[species] = {
+                'columns': {name: getattr(population, name)[rows]
+                            for name in self.columns},
+                'sources': sources[leaving], 'targets': targets[leaving]}
+            population.kill(rows)
+            self.pending[species] = (movers[~leaving], sources[~leaving],
+                                     targets[~leaving])
+        return emigrants
+
+    def settle(self, immigrants):
+        """
+        Adds animals arriving from other strips, settles all movers and
+        lets the animals age and die
+        :param immigrants: list of emigrant dictionaries meant for this
+        worker
+        :return: number of animals of each species in the strip
+        """
+        population = self.island.population
+        for species, (movers, sources, targets) in self.pending.items():
+            movers, sources, targets = [movers], [sources], [targets]
+            for arrivals in immigrants:
+                group = arrivals[species]
+                columns = group['columns']
+                rows = population.add_many(species, columns['age'],
+                                           columns['weight'])
+                for name in self.columns:
+                    getattr(population, name)[rows] = columns[name]
+                movers.append(rows)
+                sources.append(group['sources'])
+                targets.append(group['targets'])
+            movers = np.concatenate(movers)
+            targets = np.concatenate(targets)
+            population.cell[movers] = targets
+            self.island.settle_movers(species, movers,
+                                      np.concatenate(sources), targets)
+        self.pending = {}
+        self.island.grow_and_die()
+        return self.totals()
+
+    def give_cells(self, cell_ids):
+        """
+        Removes cells from the worker
+        :param cell_ids: flat indices of the cells
+        :return: list with state of each cell, its fodder, random stream
+        and animals
+        """
+        population = self.island.population
+        states = []
+        for cell_id in cell_ids:
+            cell = self.island.flat_cells[cell_id]
+            animals = {}
+            for species, rows in cell.fauna_rows.items():
+                animals[species] = {name: getattr(population, name)[rows]
+                                    for name in self.columns}
+                population.kill(rows)
+                cell.set_fauna_rows(species, np.empty(0, dtype=int))
+            states.append({'cell_id': cell_id, 'rng': cell.rng,
+                           'food': dict(cell._remaining_food),
+                           'fodder_year': cell.fodder_year,
+                           'animals': animals})
+        return states
+
+    def take_cells(self, states, owners, worker):
+        """
+        Adds cells given up by other workers
+        :param states: list of cell states from give_cells
+        :param owners: array with the new owner of each cell
+        :param worker: number of this worker
+        """
+        population = self.island.population
+        for state in states:
+            cell = self.island.flat_cells[state['cell_id']]
+            cell.rng = state['rng']
+            cell._remaining_food = state['food']
+            cell.fodder_year = state['fodder_year']
+            for species, columns in state['animals'].items():
+                rows = population.add_many(species, columns['age'],
+                                           columns['weight'])
+                for name in self.columns:
+                    getattr(population, name)[rows] = columns[name]
+                cell.add_rows(species, rows)
+        self.owners = owners
+        self.owned = owners == worker
+
+    def population_arrays(self):
+        return self.island.population_arrays()
+
+    def get_state(self):
+        return self.island.get_state(np.flatnonzero(self.owned &
+                                                    self.island.migratable))
+
+    def set_state(self, state):
+        self.island.set_state(state, np.flatnonzero(self.owned))
+        return self.totals()
+
+    def totals(self):
+        return {species: self.island.total_animals_per_species(species)
+                for species in self.island.fauna_dict}
+
+    def fodder_grid(self):
+        return self.island.fodder_grid().ravel()[self.owned]
+
+    def census(self):
+        """
+        :return: dictionary with array of animal counts per owned cell
+        """
+        _, counts = self.island.herbivore_weight_and_counts()
+        return counts
+
+
+def serve(connection, *args):
+    """
+    Main loop of a worker process, calls methods of an IslandWorker for
+    every message (method name, arguments) until it receives None
+    :param connection: end of a pipe to the main process
+    :param args: arguments for IslandWorker
+    """
+    worker = IslandWorker(*args)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        method, arguments = message
+        connection.send(getattr(worker, method)(*arguments))
+    connection.close()
+
+
+class ParallelIsland:
+    """
+    Island whose rows are split into strips simulated by worker
+    processes. It has the same stepping and statistics methods as Island
+    """
+
+    def __init__(self, island_map, seed=None, num_workers=None,
+                 rebalance_every=None, kernel_backend=None):
+        """
+        :param island_map: Multi-line string specifying island geography
+        :param seed: Integer used as random number seed, without seed one
+        is drawn from fresh entropy so that all workers agree on it
+        :param num_workers: number of worker processes, default is the
+        number of cores but at most one per row of the map
+        :param rebalance_every: number of years between redistributing the
+        cells by their cost, None keeps the first split
+        :param kernel_backend: 'python' or 'numba', kernels of the workers,
+        see Island
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.island = Island(island_map, seed=seed,
+                             kernel_backend=kernel_backend)
+        self.kernel_backend = self.island.kernel_backend
+        self.map_dims = self.island.map_dims
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        num_workers = max(1, min(num_workers, self.map_dims[0]))
+        self.owners = strip_owners(self.map_dims, num_workers)
+        self.rebalance_every = rebalance_every
+        self.year = 0
+        self._parameters = None
+        self._totals = [{species: 0 for species in self.island.fauna_dict}
+                        for _ in range(num_workers)]
+        self._connections = []
+        self._processes = []
+        for worker in range(num_workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=serve, daemon=True,
+                args=(worker_connection, island_map, seed,
+                      self.kernel_backend, self.owners, worker))
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    def _call(self, method, arguments=None):
+        """
+        Calls a method on all workers at once
+        :param method: name of the IslandWorker method
+        :param arguments: list with a tuple of arguments for every worker,
+        default is no arguments
+        :return: list with the result of every worker
+        """
+        if arguments is None:
+            arguments = [()] * len(self._connections)
+        for connection, worker_arguments in zip(self._connections,
+                                                arguments):
+            connection.send((method, worker_arguments))
+        return [connection.recv() for connection in self._connections]
+
+    def _send_parameters(self):
+        """
+        Sends the parameters of animals and landscapes to the workers if
+        they were changed since they were last sent, the workers only
+        have the parameters they were started with
+        """
+        parameters = current_parameters()
+        if parameters != self._parameters:
+            self._call('set_parameters',
+                       [(parameters,)] * len(self._connections))
+            self._parameters = parameters
+
+    def add_animals(self, pop):
+        """
+        Adds animals to the workers owning their cells
+        :param pop: list of dictionaries with loc and pop
+        """
+        cols = self.map_dims[1]
+        groups = [[] for _ in self._connections]
+        for animal_group in pop:
+            row, col = animal_group['loc']
+            groups[self.owners[row * cols + col]].append(animal_group)
+        self._call('add_animals', [(group,) for group in groups])
+        self._totals = self._call('totals')
+
+    def life_cycle(self):
+        """
+        One year on the island, see Island.life_cycle
+        """
+        self._send_parameters()
+        self.year += 1
+        results = self._call('feed_and_breed')
+        active = np.concatenate([result[0] for result in results])
+        herb_weight = sum(result[1] for result in results)
+        counts = {species: sum(result[2][species] for result in results)
+                  for species in Population.species_codes}
+        fodder = np.zeros(len(self.owners))
+        needed = self.island.cells_next_to(active)
+        owners = self.owners[needed]
+        requests = [(needed[owners == worker],)
+                    for worker in range(len(self._connections))]
+        for (cell_ids,), values in zip(requests,
+                                       self._call('fodder_of_cells',
+                                                  requests)):
+            fodder[cell_ids] = values
+        grids = self.island.build_propensity_grids(fodder, herb_weight,
+                                                   counts)
+        emigrants = self._call('migrate',
+                               [(grids,)] * len(self._connections))
+        immigrants = [[] for _ in self._connections]
+        for outgoing in emigrants:
+            for worker in range(len(self._connections)):
+                arrivals = {}
+                for species, group in outgoing.items():
+                    coming = self.owners[group['targets']] == worker
+                    arrivals[species] = {
+                        'columns': {name: values[coming] for name, values
+                                    in group['columns'].items()},
+                        'sources': group['sources'][coming],
+                        'targets': group['targets'][coming]}
+                immigrants[worker].append(arrivals)
+        self._totals = self._call('settle',
+                                  [(arrivals,) for arrivals in immigrants])
+        if self.rebalance_every and self.year % self.rebalance_every == 0:
+            self.rebalance()
+
+    def rebalance(self):
+        """
+        Hands cells between workers so that the estimated cost of every
+        worker is about the same, the cells stay in contiguous runs
+        """
+        num_workers = len(self._connections)
+        owners = balanced_owners(cell_costs(self.census_counts()),
+                                 num_workers)
+        moving = owners != self.owners
+        if not moving.any():
+            return
+        outgoing = self._call('give_cells', [
+            (np.flatnonzero(moving & (self.owners == worker)),)
+            for worker in range(num_workers)])
+        incoming = [[] for _ in range(num_workers)]
+        for states in outgoing:
+            for state in states:
+                incoming[owners[state['cell_id']]].append(state)
+        self._call('take_cells', [(incoming[worker], owners, worker)
+                                  for worker in range(num_workers)])
+        self.owners = owners
+
+    def total_animals_per_species(self, species):
+        """
+        :param species: 'Herbivore' or 'Carnivore'
+        :return: number of animals of the species on the island
+        """
+        return sum(totals[species] for totals in self._totals)
+
+    def fodder_grid(self):
+        """
+        :return: array of map shape with fodder of every cell
+        """
+        self._send_parameters()
+        fodder = np.zeros(len(self.owners))
+        for worker, values in enumerate(self._call('fodder_grid')):
+            fodder[self.owners == worker] = values
+        return fodder.reshape(self.map_dims)
+
+    def census(self):
+        """
+        Number of animals of each species in every cell, see Island.census
+        :return: array of shape (species, rows, columns)
+        """
+        counts = self.census_counts()
+        return np.stack([counts[species].reshape(self.map_dims)
+                         for species in Population.species_codes])
+
+    def census_counts(self):
+        """
+        :return: dictionary with array of animal counts per cell, by flat
+        index, for every species
+        """
+        results = self._call('census')
+        return {species: sum(counts[species] for counts in results)
+                for species in Population.species_codes}
+
+    def population_arrays(self):
+        """
+        Columns of all living animals gathered from all workers, see
+        Island.population_arrays
+        :return: dictionary of arrays
+        """
+        arrays = self._call('population_arrays')
+        return {name: np.concatenate([worker_arrays[name]
+                                      for worker_arrays in arrays])
+                for name in arrays[0]}
+
+    def get_state(self):
+        """
+        State of the island gathered from all workers, see
+        Island.get_state
+        :return: dictionary of arrays
+        """
+        states = self._call('get_state')
+        state = {}
+        for name, value in states[0].items():
+            if name == 'year':
+                state[name] = value
+            else:
+                state[name] = np.concatenate([worker_state[name]
+                                              for worker_state in states])
+        return state
+
+    def set_state(self, state):
+        """
+        Hands every worker the saved state of its cells
+        :param state: dictionary of arrays from get_state
+        """
+        self.year = int(state['year'])
+        self._totals = self._call('set_state',
+                                  [(state,)] * len(self._connections))
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        for connection in self._connections:
+            connection.send(None)
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
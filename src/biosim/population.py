@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar storage of all animals on the island. Every animal is one row
+of a set of contiguous NumPy arrays, Herbivore and Carnivore objects are
+lightweight views into a row.
+The store also counts the animals of each species on the island and in
+every cell, the cells update the counts whenever their animals change
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import numpy as np
+
+
+class Population:
+    """
+    Structure-of-arrays store for animals. Rows of dead animals are
+    recycled for new animals, so a row index stays valid for the whole
+    life of an animal
+    """
+    species_codes = {'Herbivore': 0, 'Carnivore': 1}
+    columns = {'age': (int, 0),
+               'weight': (float, 0.0),
+               'cell': (int, -1),
+               'species': (np.int8, -1),
+               'alive': (bool, False),
+               'fitness': (float, np.nan),
+               'moved_year': (int, -1)}
+
+    def __init__(self, capacity=64, num_cells=0):
+        """
+        Creates empty columns
+        :param capacity: number of rows allocated up front
+        :param num_cells: number of cells whose animals are counted
+        """
+        for name, (dtype, fill) in self.columns.items():
+            setattr(self, name, np.full(capacity, fill, dtype=dtype))
+        self.num_rows = 0
+        self.free_rows = []
+        self.parameter_versions = {}
+        self.active_cells = set()
+        self.year = 0
+        self.revision = 0
+        self.species_counts = np.zeros(len(self.species_codes), dtype=int)
+        self.cell_counts = np.zeros((len(self.species_codes), num_cells),
+                                    dtype=int)
+
+    def __len__(self):
+        """
+        :return: number of living animals in the store
+        """
+        return self.num_rows - len(self.free_rows)
+
+    @property
+    def capacity(self):
+        """
+        :return: number of allocated rows
+        """
+        return len(self.alive)
+
+    @property
+    def rows(self):
+        """
+        :return: array with row index of every living animal
+        """
+        return np.flatnonzero(self.alive[:self.num_rows])
+
+    def reserve(self, num_rows):
+        """
+        Grows all columns so that num_rows more rows can be appended
+        without reallocating
+        :param num_rows: number of rows needed
+        """
+        needed = self.num_rows + num_rows
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2 * self.capacity)
+        for name, (dtype, fill) in self.columns.items():
+            column = np.full(capacity, fill, dtype=dtype)
+            column[:self.num_rows] = getattr(self, name)[:self.num_rows]
+            setattr(self, name, column)
+
+    def add(self, species, age, weight, cell=-1):
+        """
+        Adds one animal to the store
+        :param species: 'Herbivore' or 'Carnivore'
+        :param age: age of animal
+        :param weight: weight of animal
+        :param cell: flat index of the cell the animal lives in
+        :return: row index of the animal
+        """
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            self.reserve(1)
+            row = self.num_rows
+            self.num_rows += 1
+        self.age[row] = age
+        self.weight[row] = weight
+        self.cell[row] = cell
+        self.species[row] = self.species_codes[species]
+        self.alive[row] = True
+        self.fitness[row] = np.nan
+        self.moved_year[row] = -1
+        return row
+
+    def add_many(self, species, ages, weights, cell=-1):
+        """
+        Adds a group of animals of the same species in one go
+        :param species: 'Herbivore' or 'Carnivore'
+        :param ages: sequence of ages
+        :param weights: sequence of weights
+        :param cell: flat index of the cell the animals live in
+        :return: array with the row index of every added animal
+        """
+        ages = np.asarray(ages, dtype=int)
+        num_new = len(ages)
+        num_reused = min(num_new, len(self.free_rows))
+        reused = self.free_rows[len(self.free_rows) - num_reused:]
+        del self.free_rows[len(self.free_rows) - num_reused:]
+        self.reserve(num_new - num_reused)
+        appended = np.arange(self.num_rows,
+                             self.num_rows + num_new - num_reused)
+        self.num_rows += num_new - num_reused
+        rows = np.concatenate((np.array(reused[::-1], dtype=int), appended))
+        self.age[rows] = ages
+        self.weight[rows] = weights
+        self.cell[rows] = cell
+        self.species[rows] = self.species_codes[species]
+        self.alive[rows] = True
+        self.fitness[rows] = np.nan
+        self.moved_year[rows] = -1
+        return rows
+
+    def kill(self, rows):
+        """
+        Marks animals as dead and makes their rows available again
+        :param rows: row indices of the animals that died
+        """
+        rows = np.asarray(rows, dtype=int)
+        rows = rows[self.alive[rows]]
+        self.alive[rows] = False
+        self.cell[rows] = -1
+        self.free_rows.extend(rows.tolist())
+
+    def update_counts(self, species, cell_id, change):
+        """
+        Updates the counts when the number of animals of a species in a
+        cell changes
+        :param species: 'Herbivore' or 'Carnivore'
+        :param cell_id: flat index of the cell
+        :param change: number of animals added, negative if animals left
+        """
+        code = self.species_codes[species]
+        self.species_counts[code] += change
+        self.cell_counts[code, cell_id] += change
+
+    def advance_year(self):
+        """
+        Moves the store one year on
+        """
+        self.year += 1
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""
+Buffered random number streams. Uniform and normal numbers are drawn in
+blocks and handed out one by one or as arrays.
+Every cell of a seeded island has its own stream, spawned from one
+SeedSequence, so results do not depend on the order in which cells are
+processed or on how cells are split between processes
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import json
+
+import numpy as np
+
+
+def spawn_streams(seed, num_streams, block_size=256):
+    """
+    Creates independent streams from one seed
+    :param seed: integer seed or SeedSequence
+    :param num_streams: number of streams
+    :param block_size: number of values drawn from generator at a time
+    :return: list of RandomStream
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [RandomStream(child, block_size)
+            for child in seed.spawn(num_streams)]
+
+
+class RandomStream:
+    """
+    Draws random numbers in blocks from a generator and hands them out
+    cheaply. The numbers come out in the same order as they are drawn from
+    the generator, so the same seed gives the same stream
+    """
+
+    def __init__(self, generator=None, block_size=256):
+        """
+        :param generator: numpy Generator or SeedSequence, default is the
+        global numpy random state. A Generator for a SeedSequence is only
+        created when the first number is drawn
+        :param block_size: number of values drawn from generator at a time
+        """
+        if generator is None:
+            generator = np.random
+        self._generator = generator
+        self.block_size = block_size
+        self._uniforms = np.empty(0)
+        self._next_uniform = 0
+        self._normals = np.empty(0)
+        self._next_normal = 0
+
+    @property
+    def generator(self):
+        """
+        :return: generator the stream draws from
+        """
+        if isinstance(self._generator, np.random.SeedSequence):
+            self._generator = np.random.default_rng(self._generator)
+        return self._generator
+
+    def random(self, size=None):
+        """
+        Uniform random numbers in [0, 1)
+        :param size: number of values, None gives a single float
+        """
+        if size is None:
+            if self._next_uniform == len(self._uniforms):
+                self._uniforms = self.generator.random(self.block_size)
+                self._next_uniform = 0
+            value = self._uniforms[self._next_uniform]
+            self._next_uniform += 1
+            return float(value)
+        values, self._uniforms, self._next_uniform = self._take(
+            self._uniforms, self._next_uniform, size, self.generator.random)
+        return values
+
+    def take_buffered(self):
+        """
+        Hands out all uniform numbers which are already drawn from the
+        generator, without drawing new ones
+        :return: array of uniform numbers
+        """
+        values = self._uniforms[self._next_uniform:]
+        self._uniforms = np.empty(0)
+        self._next_uniform = 0
+        return values
+
+    def put_back(self, values):
+        """
+        Puts uniform numbers which were drawn but not used back in front
+        of the stream, they are the next numbers drawn
+        :param values: array with the unused numbers, in drawing order
+        """
+        self._uniforms = np.concatenate(
+            (values, self._uniforms[self._next_uniform:]))
+        self._next_uniform = 0
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        """
+        Normally distributed random numbers
+        :param loc: mean of distribution
+        :param scale: standard deviation of distribution
+        :param size: number of values, None gives a single float
+        """
+        if size is None:
+            if self._next_normal == len(self._normals):
+                self._normals = self.generator.standard_normal(
+                    self.block_size)
+                self._next_normal = 0
+            value = self._normals[self._next_normal]
+            self._next_normal += 1
+            return loc + scale * float(value)
+        values, self._normals, self._next_normal = self._take(
+            self._normals, self._next_normal, size,
+            self.generator.standard_normal)
+        return loc + scale * values
+
+    def get_state(self):
+        """
+        State of the stream, enough to go on drawing the same numbers
+        later. The state of the generator is kept as a JSON string, its
+        integers can be larger than 64 bits
+        :return: dictionary with the generator state and block size and the
+        uniform and normal numbers which are drawn but not handed out yet
+        """
+        generator = self.generator
+        if generator is np.random:
+            state = np.random.get_state(legacy=False)
+        else:
+            state = generator.bit_generator.state
+        state = {'global': generator is np.random, 'state': state,
+                 'block_size': self.block_size}
+        return {'generator': json.dumps(state, default=np.ndarray.tolist),
+                'uniforms': self._uniforms[self._next_uniform:].copy(),
+                'normals': self._normals[self._next_normal:].copy()}
+
+    def set_state(self, state):
+        """
+        Puts the stream back into a state from get_state, the stream then
+        draws from the same kind of generator as the saved one
+        :param state: dictionary from get_state
+        """
+        saved = json.loads(str(state['generator']))
+        generator_state = saved['state']
+        self.block_size = saved['block_size']
+        if saved['global']:
+            generator_state['state']['key'] = np.array(
+                generator_state['state']['key'], dtype=np.uint32)
+            np.random.set_state(generator_state)
+            self._generator = np.random
+        else:
+            bit_generator = getattr(np.random,
+                                    generator_state['bit_generator'])()
+            bit_generator.state = generator_state
+            self._generator = np.random.Generator(bit_generator)
+        self._uniforms = np.asarray(state['uniforms'], dtype=float)
+        self._next_uniform = 0
+        self._normals = np.asarray(state['normals'], dtype=float)
+        self._next_normal = 0
+
+    def _take(self, block, position, size, draw):
+        """
+        Takes size values from block, drawing a new block when the
+        current one runs out
+        :return: values, current block and position in it
+        """
+        available = len(block) - position
+        if size <= available:
+            return block[position:position + size], block, position + size
+        new_block = draw(max(self.block_size, size - available))
+        values = np.concatenate((block[position:],
+                                 new_block[:size - available]))
+        return values, new_block, size - available
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+Streaming writer for the number of animals in every cell over the years.
+Counts are kept in memory and appended in chunks to one .npz file, every
+chunk is a pair of arrays with the years and the counts of those years.
+Chunks already written are never touched again, so a simulation which is
+stopped only loses the years still in memory
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import os
+import zipfile
+
+import numpy as np
+
+
+class ResultsWriter:
+    """
+    Buffers yearly animal counts per cell and appends them to a .npz file
+    """
+
+    def __init__(self, path, species, map_dims, every=1, chunk_years=100,
+                 keep_until=None):
+        """
+        :param path: name of the .npz file, its directory is created if
+        needed and an existing file is replaced
+        :param species: names of the species, in the order they are stored
+        :param map_dims: number of rows and columns of the map
+        :param every: number of years between recorded years
+        :param chunk_years: number of recorded years kept in memory before
+        they are written
+        :param keep_until: year up to which the results already in the file
+        are kept and appended to, later years are dropped. Used when a
+        simulation goes on from a checkpoint
+        """
+        if every < 1 or chunk_years < 1:
+            raise ValueError('every and chunk_years must be positive')
+        self.path = path
+        self.species = list(species)
+        self.every = every
+        self.chunk_years = chunk_years
+        self.num_chunks = 0
+        self._years = []
+        self._counts = []
+        kept = []
+        if keep_until is not None and os.path.exists(path):
+            for years, counts in zip(*read_chunks(path)):
+                recorded = years <= keep_until
+                if recorded.any():
+                    kept.append((years[recorded], counts[recorded]))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with zipfile.ZipFile(path, 'w') as archive:
+            self._write_array(archive, 'species', np.array(self.species))
+            self._write_array(archive, 'map_dims', np.array(map_dims))
+            for years, counts in kept:
+                self._write_chunk(archive, years, counts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def records(self, year):
+        """
+        :param year: year of the simulation
+        :return: True if the counts of the year are recorded
+        """
+        return year % self.every == 0
+
+    def record(self, year, census):
+        """
+        Keeps the counts of a year if it is one of the recorded years
+        :param year: year of the counts
+        :param census: array of shape (species, rows, columns) with the
+        number of animals in every cell, see Island.census
+        """
+        if not self.records(year):
+            return
+        self._years.append(year)
+        self._counts.append(np.array(census))
+        if len(self._years) >= self.chunk_years:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the years kept in memory to the file as a new chunk
+        """
+        if not self._years:
+            return
+        with zipfile.ZipFile(self.path, 'a') as archive:
+            self._write_chunk(archive, np.array(self._years),
+                              np.stack(self._counts))
+        self._years = []
+        self._counts = []
+
+    def close(self):
+        """
+        Writes the years still kept in memory
+        """
+        self.flush()
+
+    def _write_chunk(self, archive, years, counts):
+        """
+        Writes the years and counts of the next chunk into the archive
+        """
+        name = '{:05d}'.format(self.num_chunks)
+        self._write_array(archive, 'years_' + name, years)
+        self._write_array(archive, 'counts_' + name, counts)
+        self.num_chunks += 1
+
+    @staticmethod
+    def _write_array(archive, name, array):
+        """
+        Writes an array into the archive the way numpy.savez does
+        """
+        with archive.open(name + '.npy', 'w', force_zip64=True) as file:
+            np.lib.format.write_array(file, np.asanyarray(array))
+
+
+def read_chunks(path):
+    """
+    Reads the chunks of a file written by ResultsWriter in the order they
+    were written
+    :param path: name of the .npz file
+    :return: list with the years of every chunk and list with the counts
+    of every chunk
+    """
+    with np.load(path) as data:
+        chunks = sorted(name[len('years_'):] for name in data.files
+                        if name.startswith('years_'))
+        return ([data['years_' + chunk] for chunk in chunks],
+                [data['counts_' + chunk] for chunk in chunks])
+
+
+def read_results(path):
+    """
+    Reads a file written by ResultsWriter
+    :param path: name of the .npz file
+    :return: array with the recorded years and dictionary with an array of
+    shape (years, rows, columns) of animal counts for each species
+    """
+    with np.load(path) as data:
+        species = [str(name) for name in data['species']]
+        rows, cols = data['map_dims']
+    years, counts = read_chunks(path)
+    if not years:
+        years = [np.empty(0, dtype=int)]
+        counts = [np.zeros((0, len(species), rows, cols), dtype=int)]
+    years = np.concatenate(years)
+    counts = np.concatenate(counts)
+    return years, {name: counts[:, index]
+                   for index, name in enumerate(species)}
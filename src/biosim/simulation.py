@@ -8,21 +8,24 @@ __author__ = "Hemanth Sana & Mithunan Sivagnanam"
 __email__ = "hesa@nmbu.no & misi@nmbu.no"
 
 import os
-import random
 
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import subprocess
 
-from biosim.island import Island
+from biosim.engines import create_engine
 from biosim.landscape import Ocean, Savannah, Desert, Jungle, Mountain
 from biosim.fauna import Carnivore, Herbivore
 from biosim.graphics import Graphics
+from biosim.history import HistoryRecorder
+from biosim.population import Population
+from biosim.results import ResultsWriter
 
 DEFAULT_GRAPHICS_DIR = os.path.join('results/')
 DEFAULT_GRAPHICS_NAME = 'biosim'
 DEFAULT_MOVIE_FORMAT = 'mp4'
+DEFAULT_RESULTS_FILE = os.path.join(DEFAULT_GRAPHICS_DIR, 'data.npz')
 
 FFMPEG_BINARY = 'ffmpeg'
 CONVERT_BINARY = 'magick'
@@ -38,6 +41,13 @@ class BioSim:
         cmax_animals=None,
         img_base=None,
         img_fmt="png",
+        kernel_backend="python",
+        engine="array",
+        engine_options=None,
+        results_file=DEFAULT_RESULTS_FILE,
+        results_years=1,
+        results_chunk=100,
+        history_dir=None,
     ):
         """
         :param island_map: Multi-line string specifying island geography
@@ -50,6 +60,26 @@ class BioSim:
         :param img_base: String with beginning of file name for figures,
         including path
         :param img_fmt: String with file type for figures, e.g. 'png'
+        :param kernel_backend: 'python' or 'numba', 'numba' runs feeding,
+        predation and migration sampling as compiled kernels if numba is
+        installed, see kernels.kernel_set. The kernels belong to the island
+        of this simulation, other simulations keep their own
+        :param engine: 'reference', 'array' or 'parallel', engine which
+        simulates the island, see biosim.engines
+        :param engine_options: Dict with options of the engine, e.g.
+        {'num_workers': 4} for the parallel engine
+        :param results_file: String with name of the .npz file the number
+        of animals in every cell is written to, None writes no results,
+        see biosim.results. A simulation loaded from a checkpoint keeps the
+        years up to the checkpoint already in the file
+        :param results_years: years between years written to results_file
+        :param results_chunk: number of years kept in memory before they are
+        appended to results_file
+        :param history_dir: String with name of a directory the age, weight
+        and fitness of all animals are recorded to every year, None
+        records no history, see biosim.history. A simulation loaded from a
+        checkpoint keeps the years up to the checkpoint already in the
+        directory
 
         If ymax_animals is None, the y-axis limit should be adjusted
         automatically.
@@ -65,6 +95,11 @@ class BioSim:
 
         where img_no are consecutive image numbers starting from 0.
         img_base should contain a path and beginning of a file name.
+
+        Call close() when the simulation is done, it stops the worker
+        processes of the parallel engine and writes the results still in
+        memory. BioSim can also be used in a with statement, which closes
+        it at the end.
         """
         self.landscapes = {'O': Ocean,
                            'S': Savannah,
@@ -84,8 +119,12 @@ class BioSim:
         if len(set(lengths)) > 1:
             raise ValueError('This given string is not uniform')
         self.island_map = island_map
-        self._map = Island(island_map)
-        random.seed(seed)
+        if engine_options is None:
+            engine_options = {}
+        self._engine = create_engine(engine, island_map, seed,
+                                     kernel_backend=kernel_backend,
+                                     **engine_options)
+        self.kernel_backend = self._engine.island.kernel_backend
         self.add_population(ini_pop)
 
         if ymax_animals is None:
@@ -106,6 +145,13 @@ class BioSim:
         self.img_fmt = img_fmt
         self.img_counter = 0
 
+        self.results_file = results_file
+        self.results_years = results_years
+        self.results_chunk = results_chunk
+        self.results = None
+        self.history_dir = history_dir
+        self.history = None
+
         self.vis = None
         self._year = 0
         self.final_year = None
@@ -119,8 +165,7 @@ class BioSim:
         """
         if species in self.animal_species:
             species_type = self.animal_species[species]
-            animal = species_type()
-            animal.set_parameters(params)
+            species_type.set_parameters(params)
         else:
             raise TypeError(species + ' parameters can\'t be assigned, '
                                       'there is no such data type')
@@ -165,24 +210,61 @@ class BioSim:
                                             self.ymax_animals,
                                             recreate=True)
 
-        while self._year < self.final_year:
-            if self._year % vis_years == 0:
-                self.update_graphics()
-
-            if (self._year + 1) % img_years == 0:
-                self.save_graphics()
-
-            self._map.life_cycle()
-            self._year += 1
-
-            df = self.animal_distribution
-            df.to_csv('results/data.csv', sep='\t', encoding='utf-8')
+        if self.results is None and self.results_file is not None:
+            self.results = ResultsWriter(self.results_file,
+                                         list(Population.species_codes),
+                                         self._engine.map_dims,
+                                         self.results_years,
+                                         self.results_chunk,
+                                         keep_until=self._year)
+        if self.history is None and self.history_dir is not None:
+            self.history = HistoryRecorder(self.history_dir,
+                                           keep_until=self._year)
+        try:
+            while self._year < self.final_year:
+                if self._year % vis_years == 0:
+                    self.update_graphics()
+
+                if (self._year + 1) % img_years == 0:
+                    self.save_graphics()
+
+                self._engine.step()
+                self._year += 1
+
+                if self.results is not None and \
+                        self.results.records(self._year):
+                    self.results.record(self._year, self._engine.census())
+                if self.history is not None:
+                    self.history.record(self._year,
+                                        self._engine.population_arrays())
+        finally:
+            # years kept in memory are written also when the simulation
+            # is interrupted
+            if self.results is not None:
+                self.results.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Closes the engine, the results file and the history. The simulation
+        can not be continued after it is closed
+        """
+        self._engine.close()
+        if self.results is not None:
+            self.results.close()
+        if self.history is not None:
+            self.history.close()
 
     def setup_graphics(self):
         """
         Setup the graphics
         """
-        map_dims = self._map.map_dims
+        map_dims = self._engine.map_dims
 
         if self.vis is None:
             fig = plt.figure()
@@ -198,13 +280,15 @@ class BioSim:
         """
         Updates graphics with current data.
         """
-        df = self.animal_distribution
-        rows, cols = self._map.map_dims
-        dist_matrix_carnivore = np.array(df[['Carnivore']]).reshape(rows, cols)
-        dist_matrix_herbivore = np.array(df[['Herbivore']]).reshape(rows, cols)
+        census = self._engine.census()
+        codes = Population.species_codes
+        dist_matrix_carnivore = census[codes['Carnivore']]
+        dist_matrix_herbivore = census[codes['Herbivore']]
 
         # updates the line graphs
-        herb_count, carn_count = list(self.num_animals_per_species.values())
+        num_animals = self.num_animals_per_species
+        herb_count = num_animals['Herbivore']
+        carn_count = num_animals['Carnivore']
         self.vis.update_graphs(self._year, herb_count, carn_count)
 
         self.vis.update_herbivore_dist(dist_matrix_herbivore)
@@ -219,6 +303,9 @@ class BioSim:
         if self.img_base is None:
             return
 
+        directory = os.path.dirname(self.img_base)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
         plt.savefig('{base}_{num:05d}.{type}'.format(base=self.img_base,
                                                      num=self.img_counter,
                                                      type=self.img_fmt))
@@ -230,7 +317,59 @@ class BioSim:
 
         :param population: List of dictionaries specifying population
         """
-        self._map.add_animals(population)
+        self._engine.add_population(population)
+
+    def save_checkpoint(self, path):
+        """
+        Saves the state of the simulation to a compressed .npz file: the
+        map, fodder and random stream of every cell, the animals as
+        arrays, the parameters of animals and landscapes and the year
+
+        :param path: String with name of the file
+        """
+        state = self._engine.get_state()
+        state['island_map'] = np.array(self.island_map)
+        state['sim_year'] = self._year
+        parameter_classes = dict(self.animal_species)
+        parameter_classes.update({landscape.__name__: landscape for landscape
+                                  in self.landscapes_with_parameters})
+        for name, parameter_class in parameter_classes.items():
+            parameters = parameter_class.parameters
+            state[name + '_parameter_names'] = np.array(list(parameters))
+            state[name + '_parameter_values'] = np.array(
+                list(parameters.values()), dtype=float)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, **state)
+
+    @classmethod
+    def load_checkpoint(cls, path, **kwargs):
+        """
+        Creates a simulation from a file written by save_checkpoint, it
+        goes on exactly as the saved simulation would have
+
+        :param path: String with name of the file
+        :param kwargs: other arguments of BioSim, e.g. engine or img_base
+        :return: BioSim
+        """
+        with np.load(path) as data:
+            state = dict(data)
+        for species, fauna_class in {'Herbivore': Herbivore,
+                                     'Carnivore': Carnivore}.items():
+            fauna_class.parameters.update(zip(
+                state[species + '_parameter_names'].tolist(),
+                state[species + '_parameter_values'].tolist()))
+            fauna_class.parameter_version += 1
+        for landscape in (Savannah, Jungle):
+            landscape.set_parameters(dict(zip(
+                state[landscape.__name__ + '_parameter_names'].tolist(),
+                state[landscape.__name__ + '_parameter_values'].tolist())))
+        sim = cls(str(state['island_map']), [], seed=None, **kwargs)
+        sim._engine.set_state(state)
+        sim._year = int(state['sim_year'])
+        return sim
 
     def make_movie(self, movie_fmt=DEFAULT_MOVIE_FORMAT):
         """Create MPEG4 movie from visualization images saved."""
@@ -272,31 +411,25 @@ class BioSim:
     @property
     def num_animals(self):
         """Total number of animals on island."""
-        animal_count = 0
-        for species in self.animal_species:
-            animal_count += self._map.total_animals_per_species(species)
-            return animal_count
+        num_fauna_per_species = self._engine.num_animals_per_species()
+        return sum(num_fauna_per_species[species]
+                   for species in self.animal_species)
 
     @property
     def num_animals_per_species(self):
         """Number of animals per species in island, as dictionary."""
-        num_fauna_per_species = {}
-        for species in self.animal_species:
-            num_fauna_per_species[species] = self._map.\
-                total_animals_per_species(species)
-        return num_fauna_per_species
+        num_fauna_per_species = self._engine.num_animals_per_species()
+        return {species: num_fauna_per_species[species]
+                for species in self.animal_species}
 
     @property
     def animal_distribution(self):
         """Pandas DataFrame with animal count per species for each cell
-        on island."""
-        animal_df = []
-        rows, cols = self._map.map_dims
-        for row in range(rows):
-            for col in range(cols):
-                cell = self._map.cells[row, col]
-                animal_count = cell.cell_fauna_count
-                animal_df.append({'Row': row, 'Col': col,
-                                  'Herbivore': animal_count['Herbivore'],
-                                  'Carnivore': animal_count['Carnivore']})
-        return pd.DataFrame(animal_df)
+        on island. It is only built when asked for, from the census of
+        the island."""
+        census = self._engine.census()
+        rows, cols = np.indices(self._engine.map_dims)
+        codes = Population.species_codes
+        return pd.DataFrame({'Row': rows.ravel(), 'Col': cols.ravel(),
+                             'Herbivore': census[codes['Herbivore']].ravel(),
+                             'Carnivore': census[codes['Carnivore']].ravel()})
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fixtures shared by the tests
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+
+
+@pytest.fixture
+def island_pop():
+    """
+    Small island with herbivores and carnivores in one cell
+    :return: map string and initial population
+    """
+    map_str = 'OOOOO\nOJJSO\nOJDSO\nOOOOO'
+    herbivores = [{'species': 'Herbivore', 'age': 5, 'weight': 20.0}
+                  for _ in range(30)]
+    carnivores = [{'species': 'Carnivore', 'age': 5, 'weight': 20.0}
+                  for _ in range(5)]
+    pop = [{'loc': (1, 1), 'pop': herbivores + carnivores}]
+    return map_str, pop
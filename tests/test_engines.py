@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for engines.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+import numpy as np
+
+from biosim.engines import create_engine, ArrayEngine, ReferenceEngine
+from biosim.population import Population
+from biosim.results import read_results
+from biosim.simulation import BioSim
+
+
+class TestEngines:
+    def test_create_engine(self, island_pop):
+        map_str, _ = island_pop
+        assert isinstance(create_engine('array', map_str), ArrayEngine)
+        assert isinstance(create_engine('reference', map_str),
+                          ReferenceEngine)
+
+    def test_unknown_engine(self, island_pop):
+        map_str, _ = island_pop
+        with pytest.raises(ValueError):
+            create_engine('gpu', map_str)
+
+    @pytest.mark.parametrize('name', ['reference', 'array'])
+    def test_census_matches_counts(self, island_pop, name):
+        map_str, pop = island_pop
+        engine = create_engine(name, map_str, seed=2)
+        engine.add_population(pop)
+        for _ in range(3):
+            engine.step()
+        census = engine.census()
+        counts = engine.num_animals_per_species()
+        assert census.shape == (2,) + engine.map_dims
+        for species, code in Population.species_codes.items():
+            assert census[code].sum() == counts[species]
+
+    def test_parallel_same_as_array(self, island_pop):
+        """
+        The parallel engine gives the same result as the array engine
+        """
+        map_str, pop = island_pop
+        array = create_engine('array', map_str, seed=3)
+        array.add_population(pop)
+        parallel = create_engine('parallel', map_str, seed=3,
+                                 num_workers=2)
+        try:
+            parallel.add_population(pop)
+            for _ in range(4):
+                array.step()
+                parallel.step()
+            assert parallel.num_animals_per_species() == \
+                array.num_animals_per_species()
+            assert np.array_equal(parallel.census(), array.census())
+            assert np.allclose(parallel.fodder_grid(), array.fodder_grid())
+        finally:
+            parallel.close()
+
+    def test_biosim_num_animals(self, island_pop):
+        map_str, pop = island_pop
+        sim = BioSim(map_str, pop, seed=1)
+        assert sim.num_animals == 35
+
+    def test_biosim_engine(self, island_pop):
+        map_str, pop = island_pop
+        sim = BioSim(map_str, pop, seed=1, engine='reference')
+        assert isinstance(sim._engine, ReferenceEngine)
+        assert sim.num_animals_per_species == {'Carnivore': 5,
+                                               'Herbivore': 30}
+
+    def test_biosim_close_joins_workers(self, island_pop, tmp_path):
+        map_str, pop = island_pop
+        results_file = str(tmp_path / 'data.npz')
+        with BioSim(map_str, pop, seed=1, img_base=None, engine='parallel',
+                    engine_options={'num_workers': 2},
+                    results_file=results_file, results_chunk=10) as sim:
+            sim.simulate(2, vis_years=1)
+            processes = list(sim._engine.island._processes)
+            assert all(process.is_alive() for process in processes)
+        assert not any(process.is_alive() for process in processes)
+        assert sim._engine.island._processes == []
+        years, _ = read_results(results_file)
+        assert list(years) == [1, 2]
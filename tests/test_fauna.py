@@ -96,6 +96,38 @@ class TestFauna:
         assert 0 <= herb.animal_fitness <= 1
         assert 0 <= carn.animal_fitness <= 1
 
+    def test_fitness_cached(self, animal_objects):
+        """
+        Fitness is stored in the population store after first use
+        """
+        herb, carn = animal_objects
+        fitness = herb.animal_fitness
+        assert herb.population.fitness[herb.row] == fitness
+
+    def test_fitness_updated_after_weight_change(self, animal_objects):
+        """
+        Cached fitness is recalculated after animal eats and grows
+        """
+        herb, carn = animal_objects
+        fitness_before_eat = herb.animal_fitness
+        herb.animal_eats(10)
+        assert herb.animal_fitness > fitness_before_eat
+        assert herb.animal_fitness == herb.calculate_fitness()
+        herb.animal_grows()
+        assert herb.animal_fitness == herb.calculate_fitness()
+
+    def test_fitness_updated_after_set_parameters(self, animal_objects):
+        """
+        Cached fitness is recalculated when parameters change
+        """
+        herb, carn = animal_objects
+        w_half = Herbivore.parameters['w_half']
+        fitness_before = herb.animal_fitness
+        herb.set_parameters({'w_half': w_half + 5})
+        assert herb.animal_fitness < fitness_before
+        herb.set_parameters({'w_half': w_half})
+        assert herb.animal_fitness == fitness_before
+
     def test_probability_of_birth_if_only_one_animal(self, animal_objects):
         """
         Testing probability of birth returns False when only
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for history.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+import numpy as np
+
+from biosim.history import HistoryRecorder, PopulationHistory
+from biosim.simulation import BioSim
+
+
+def arrays(num_animals, year):
+    return {'species': np.zeros(num_animals, dtype=np.int8),
+            'cell': np.arange(num_animals),
+            'age': np.full(num_animals, year),
+            'weight': np.linspace(1, 2, num_animals),
+            'fitness': np.full(num_animals, 0.5)}
+
+
+class TestHistory:
+    def test_years_read_back(self, tmp_path):
+        directory = str(tmp_path / 'history')
+        with HistoryRecorder(directory) as recorder:
+            for year, num_animals in [(1, 3), (2, 0), (3, 5)]:
+                recorder.record(year, arrays(num_animals, year))
+        history = PopulationHistory(directory)
+        assert len(history) == 3
+        assert list(history.offsets) == [0, 3, 3]
+        year = history.year(3)
+        assert isinstance(year['age'], np.memmap)
+        assert list(year['age']) == [3] * 5
+        assert np.array_equal(year['weight'], np.linspace(1, 2, 5))
+        assert len(history.year(2)['cell']) == 0
+
+    def test_unknown_year(self, tmp_path):
+        directory = str(tmp_path / 'history')
+        with HistoryRecorder(directory) as recorder:
+            recorder.record(1, arrays(2, 1))
+        with pytest.raises(ValueError):
+            PopulationHistory(directory).year(5)
+
+    def test_empty_history(self, tmp_path):
+        directory = str(tmp_path / 'history')
+        HistoryRecorder(directory).close()
+        assert len(PopulationHistory(directory)) == 0
+
+    def test_simulation_records_history(self, tmp_path):
+        directory = str(tmp_path / 'history')
+        pop = [{'loc': (1, 1),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                        for _ in range(10)]}]
+        sim = BioSim('OOOO\nOJSO\nOOOO', pop, seed=1, img_base=None,
+                     results_file=None, history_dir=directory)
+        sim.simulate(4, vis_years=1)
+        history = PopulationHistory(directory)
+        assert list(history.years) == [1, 2, 3, 4]
+        assert len(history.year(4)['age']) == sim.num_animals
+
+    def test_resume_keeps_history_until_checkpoint(self, tmp_path):
+        """
+        A simulation loaded from a checkpoint appends to the history and
+        replaces the years after the checkpoint
+        """
+        directory = str(tmp_path / 'history')
+        checkpoint = str(tmp_path / 'checkpoint.npz')
+        pop = [{'loc': (1, 1),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                        for _ in range(10)]}]
+        with BioSim('OOOO\nOJSO\nOOOO', pop, seed=1, img_base=None,
+                    results_file=None, history_dir=directory) as sim:
+            sim.simulate(2, vis_years=1)
+            sim.save_checkpoint(checkpoint)
+            sim.simulate(2, vis_years=1)
+        history = PopulationHistory(directory)
+        expected = {year: {name: np.array(column)
+                           for name, column in history.year(year).items()}
+                    for year in history.years}
+        del history
+        with BioSim.load_checkpoint(checkpoint, img_base=None,
+                                    results_file=None,
+                                    history_dir=directory) as sim:
+            sim.simulate(3, vis_years=1)
+        history = PopulationHistory(directory)
+        assert list(history.years) == [1, 2, 3, 4, 5]
+        for year, columns in expected.items():
+            for name, column in columns.items():
+                if year <= 2:
+                    assert np.array_equal(history.year(year)[name], column)
+                else:
+                    # the store is compacted when the checkpoint is loaded
+                    assert np.array_equal(np.sort(history.year(year)[name]),
+                                          np.sort(column))
@@ -8,9 +8,11 @@ __author__ = "Hemanth Sana & Mithunan Sivagnanam"
 __email__ = "hesa@nmbu.no & misi@nmbu.no"
 
 import pytest
+import numpy as np
 
-from biosim.landscape import Ocean, Mountain
+from biosim.landscape import Ocean, Mountain, Savannah
 from biosim.island import Island
+from biosim.fauna import Herbivore
 
 
 class TestIsland:
@@ -91,3 +93,222 @@ class TestIsland:
         island.add_animals(animals)
         assert island.total_animals_per_species('Herbivore') == 3
         assert island.total_animals_per_species('Carnivore') == 2
+
+    @staticmethod
+    def run_island(map_str, pop, seed, years=5):
+        island = Island(map_str, seed=seed)
+        island.add_animals(pop)
+        for _ in range(years):
+            island.life_cycle()
+        return [cell.cell_fauna_count for cell in island.cells.flat]
+
+    def test_same_seed_same_result(self, island_pop):
+        """
+        Islands with same seed give same animal counts, independent of
+        the global numpy random state
+        """
+        map_str, pop = island_pop
+        counts = self.run_island(map_str, pop, seed=42)
+        np.random.seed(1)
+        np.random.random(100)
+        assert self.run_island(map_str, pop, seed=42) == counts
+
+    def test_cells_have_own_streams(self, island_pop):
+        map_str, pop = island_pop
+        island = Island(map_str, seed=42)
+        assert island.cells[1, 1].rng is not island.cells[1, 2].rng
+        assert island.cells[1, 1].rng.random() != \
+            island.cells[1, 2].rng.random()
+
+    def test_migrate_animals_to_adjacent_cells(self, island_pop):
+        """
+        Migration keeps every animal and moves them only to neighbouring
+        cells animals can live in
+        """
+        map_str, pop = island_pop
+        island = Island(map_str, seed=7)
+        island.add_animals(pop)
+        island.migrate_animals()
+        counts = [cell.cell_fauna_count for cell in island.cells.flat]
+        assert sum(count['Herbivore'] for count in counts) == 30
+        assert sum(count['Carnivore'] for count in counts) == 5
+        for (row, col), cell in np.ndenumerate(island.cells):
+            if sum(cell.cell_fauna_count.values()) > 0:
+                assert (row, col) in [(1, 1), (1, 2), (2, 1)]
+                for rows in cell.fauna_rows.values():
+                    assert np.all(island.population.cell[rows] ==
+                                  cell.cell_id)
+
+    def test_neighbour_table(self):
+        """
+        Neighbours are listed as up, down, left, right with -1 outside
+        the map, and agree with adjacent_cells
+        """
+        map_str = """   OOOO
+                        OJSO
+                        OOOO"""
+        island = Island(map_str)
+        assert island.neighbours.shape == (12, 4)
+        assert list(island.neighbours[5]) == [1, 9, 4, 6]
+        assert list(island.neighbours[0]) == [-1, 4, -1, 1]
+        assert list(island.migratable) == [False] * 5 + [True, True] + \
+            [False] * 5
+        adjacent = island.adjacent_cells(1, 1)
+        assert adjacent == [island.cells[0, 1], island.cells[2, 1],
+                            island.cells[1, 0], island.cells[1, 2]]
+
+    def test_active_cells_are_populated_cells(self, island_pop):
+        """
+        The set of active cells always holds exactly the cells with
+        animals, also after animals have migrated and died
+        """
+        map_str, pop = island_pop
+        island = Island(map_str, seed=7)
+        island.add_animals(pop)
+        assert list(island.active_cell_ids()) == [6]
+        for _ in range(5):
+            island.life_cycle()
+            populated = {cell.cell_id for cell in island.flat_cells
+                         if sum(cell.cell_fauna_count.values())}
+            assert island.population.active_cells == populated
+
+    def test_census_matches_cells(self, island_pop):
+        map_str, pop = island_pop
+        island = Island(map_str, seed=7)
+        island.add_animals(pop)
+        for _ in range(3):
+            island.life_cycle()
+        census = island.census()
+        assert census.shape == (2, 4, 5)
+        for cell in island.cells.flat:
+            row, col = divmod(cell.cell_id, 5)
+            assert census[0, row, col] == cell.cell_fauna_count['Herbivore']
+            assert census[1, row, col] == cell.cell_fauna_count['Carnivore']
+
+    @pytest.mark.parametrize('update_order', ['phase', 'cell'])
+    def test_counts_follow_animals(self, island_pop, update_order):
+        """
+        The counts kept by the store agree with the animals in the store
+        after birth, migration and death
+        """
+        map_str, pop = island_pop
+        island = Island(map_str, seed=3, update_order=update_order)
+        island.add_animals(pop)
+        for _ in range(4):
+            island.life_cycle()
+            population = island.population
+            living = population.rows
+            for species, code in population.species_codes.items():
+                cells = population.cell[living[
+                    population.species[living] == code]]
+                assert island.total_animals_per_species(species) == \
+                    len(cells)
+                assert np.array_equal(
+                    population.cell_counts[code],
+                    np.bincount(cells, minlength=island.island_map.size))
+
+    def test_state_restores_island(self, island_pop):
+        """
+        An island restored from the state of another island goes on as
+        that island does
+        """
+        map_str, pop = island_pop
+        island = Island(map_str, seed=3)
+        island.add_animals(pop)
+        for _ in range(3):
+            island.life_cycle()
+        restored = Island(map_str)
+        restored.set_state(island.get_state())
+        for _ in range(3):
+            island.life_cycle()
+            restored.life_cycle()
+        assert np.array_equal(restored.census(), island.census())
+        assert np.array_equal(restored.fodder_grid(), island.fodder_grid())
+        for cell, restored_cell in zip(island.flat_cells,
+                                       restored.flat_cells):
+            for species, rows in cell.fauna_rows.items():
+                assert np.array_equal(
+                    restored.population.weight[
+                        restored_cell.fauna_rows[species]],
+                    island.population.weight[rows])
+
+    def test_fodder_of_empty_cells_grows_lazily(self):
+        """
+        Fodder of a cell without animals is not touched by life_cycle, but
+        is grown back when it is requested
+        """
+        map_str = """   OOOO
+                        OSSO
+                        OOOO"""
+        island = Island(map_str, seed=1)
+        savannah = island.cells[1, 2]
+        savannah.remaining_food['Herbivore'] = 0.0
+        for _ in range(3):
+            island.life_cycle()
+        assert savannah.fodder == 0.0
+        f_max = savannah.parameters['f_max']
+        alpha = savannah.parameters['alpha']
+        assert island.fodder_grid()[1, 2] == pytest.approx(
+            f_max - f_max * (1 - alpha) ** 3)
+
+    @pytest.mark.parametrize('update_order, moved_age', [('phase', 6),
+                                                         ('cell', 5)])
+    def test_update_order(self, update_order, moved_age, monkeypatch):
+        """
+        In cell order animals moving to an earlier cell miss the rest of
+        the year and do not age
+        """
+        monkeypatch.setitem(Herbivore.parameters, 'mu', 1.0)
+        map_str = """   OOOO
+                        OJJO
+                        OOOO"""
+        pop = [{"loc": (1, 2),
+                "pop": [{"species": "Herbivore", "age": 5, "weight": 40.0}
+                        for _ in range(50)]}]
+        island = Island(map_str, seed=4, update_order=update_order)
+        island.add_animals(pop)
+        island.life_cycle()
+        stayed, moved = island.cells[1, 2], island.cells[1, 1]
+        assert len(moved.fauna_rows['Herbivore']) > 0
+        assert all(animal.age == 6
+                   for animal in stayed.fauna_list['Herbivore'])
+        assert all(animal.age == moved_age
+                   for animal in moved.fauna_list['Herbivore'])
+
+    def test_cell_order_regrows_fodder_of_empty_neighbours(self,
+                                                           monkeypatch):
+        """
+        In cell order animals see the fodder of an empty grazed savannah as
+        in the original simulation, where every cell grew its fodder when
+        it was visited: grown for this year if the savannah comes before
+        the cell, up to last year if it comes after it
+        """
+        monkeypatch.setitem(Herbivore.parameters, 'mu', 0.0)
+        monkeypatch.setitem(Herbivore.parameters, 'omega', 0.0)
+        island = Island("""OOOOO\nOSJSO\nOOOOO""", seed=1,
+                        update_order='cell')
+        island.add_animals([{'loc': (1, 2),
+                             'pop': [{'species': 'Herbivore', 'age': 5,
+                                      'weight': 20.0} for _ in range(5)]}])
+        for cell_id in (6, 8):
+            island.flat_cells[cell_id]._remaining_food['Herbivore'] = 0.0
+        seen = []
+        jungle = island.flat_cells[7]
+        animal_migrates = jungle.animal_migrates
+
+        def recording_migrates(adj_cells, year=None):
+            seen.append([cell.fodder for cell in adj_cells])
+            return animal_migrates(adj_cells, year)
+        monkeypatch.setattr(jungle, 'animal_migrates', recording_migrates)
+        for _ in range(5):
+            island.life_cycle()
+        fodder = {cell.cell_id: value for cell, value in
+                  zip(island.adjacent_cells(1, 2), seen[-1])}
+        f_max = Savannah.parameters['f_max']
+        alpha = Savannah.parameters['alpha']
+        assert fodder[6] == pytest.approx(f_max * (1 - (1 - alpha) ** 5))
+        assert fodder[8] == pytest.approx(f_max * (1 - (1 - alpha) ** 4))
+
+    def test_unknown_update_order(self):
+        with pytest.raises(ValueError):
+            Island("""OOO\nOJO\nOOO""", update_order='row')
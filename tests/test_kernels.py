@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for kernels.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+import numpy as np
+
+from biosim import kernels
+from biosim.randomness import RandomStream
+from biosim.simulation import BioSim
+
+
+class TestFeedHerbivores:
+    @staticmethod
+    def feed_one_by_one(fodder, demand):
+        """
+        Herbivores eating one after another, as a reference
+        """
+        eaten = []
+        for food_required in demand:
+            food = min(fodder, food_required)
+            eaten.append(food)
+            fodder -= food
+        return eaten, fodder
+
+    @pytest.mark.parametrize('fodder', [0.0, 25.0, 300.0, 800.0])
+    def test_same_as_eating_one_by_one(self, fodder):
+        demand = np.full(37, 10.0)
+        eaten, left = kernels.feed_herbivores(fodder, demand)
+        expected_eaten, expected_left = self.feed_one_by_one(fodder, demand)
+        assert np.allclose(eaten, expected_eaten)
+        assert left == pytest.approx(expected_left)
+
+    def test_last_herbivore_eats_rest(self):
+        eaten, left = kernels.feed_herbivores(25.0, [10.0, 10.0, 10.0, 10.0])
+        assert list(eaten) == [10.0, 10.0, 5.0, 0.0]
+        assert left == 0
+
+    def test_no_herbivores(self):
+        eaten, left = kernels.feed_herbivores(300.0, [])
+        assert len(eaten) == 0
+        assert left == 300.0
+
+
+class TestPredation:
+    @pytest.fixture
+    def rng(self):
+        return RandomStream(np.random.default_rng(7))
+
+    def test_weak_carnivore_kills_nothing(self, rng):
+        eaten, killed = kernels.predation(
+            np.array([0.1]), np.array([0.2, 0.5, 0.9]),
+            np.array([10.0, 10.0, 10.0]), 50.0, 10.0, rng)
+        assert eaten[0] == 0
+        assert not killed.any()
+
+    def test_certain_kill_eats_weakest_herbivore(self, rng):
+        """
+        With small DeltaPhiMax every kill attempt succeeds, so every
+        carnivore kills the weakest herbivore still alive
+        """
+        herb_fitness = np.array([0.1, 0.2, 0.3, 0.4])
+        herb_weight = np.array([60.0, 20.0, 35.0, 10.0])
+        eaten, killed = kernels.predation(
+            np.array([0.9, 0.8]), herb_fitness, herb_weight, 50.0, 0.01, rng)
+        assert list(killed) == [True, True, False, False]
+        assert eaten[0] == 60.0
+        assert eaten[1] == 50.0
+
+    def test_kill_probability(self):
+        probability = kernels.kill_probability(
+            0.5, np.array([0.6, 0.5, 0.4, 0.0]), 0.5)
+        assert list(probability) == pytest.approx([0.0, 0.0, 0.2, 1.0])
+
+    def test_herbivore_killed_once(self, rng):
+        herb_fitness = np.linspace(0.0, 0.5, 50)
+        eaten, killed = kernels.predation(
+            np.full(30, 0.9), herb_fitness, np.full(50, 10.0), 50.0, 0.1,
+            rng)
+        assert killed.sum() == 30
+        assert np.all(eaten == 50.0)
+
+
+class TestDeaths:
+    def test_death_rate(self):
+        """
+        About omega * (1 - fitness) of the animals die
+        """
+        rng = RandomStream(np.random.default_rng(11))
+        dies = kernels.deaths(np.full(20000, 0.5), 0.4, rng)
+        assert dies.mean() == pytest.approx(0.2, abs=0.02)
+
+    def test_fit_and_unfit_animals_survive(self):
+        rng = RandomStream(np.random.default_rng(11))
+        dies = kernels.deaths(np.array([0.0, 1.0, 1.0]), 0.9, rng)
+        assert not dies.any()
+
+
+class TestBirths:
+    @pytest.fixture
+    def parameters(self):
+        return {'w_birth': 8.0, 'sigma_birth': 1.5, 'gamma': 0.2,
+                'zeta': 3.5, 'xi': 1.2}
+
+    def test_no_birth_for_single_animal(self, parameters):
+        rng = RandomStream(np.random.default_rng(2))
+        gives_birth, newborn_weight, weight_loss = kernels.births(
+            np.array([1.0]), np.array([50.0]), 1, parameters, rng)
+        assert not gives_birth.any()
+        assert len(newborn_weight) == 0
+
+    def test_light_animals_do_not_give_birth(self, parameters):
+        rng = RandomStream(np.random.default_rng(2))
+        gives_birth, newborn_weight, weight_loss = kernels.births(
+            np.full(100, 1.0), np.full(100, 20.0), 100, parameters, rng)
+        assert not gives_birth.any()
+
+    def test_one_newborn_per_mother(self, parameters):
+        rng = RandomStream(np.random.default_rng(2))
+        weight = np.full(100, 50.0)
+        gives_birth, newborn_weight, weight_loss = kernels.births(
+            np.full(100, 1.0), weight, 100, parameters, rng)
+        assert gives_birth.all()
+        assert len(newborn_weight) == 100
+        assert np.allclose(weight_loss, 1.2 * newborn_weight)
+
+
+class TestMigration:
+    def test_propensity_zero_for_closed_cells(self):
+        propensity = kernels.propensity(
+            np.array([100.0, 100.0, 0.0]), np.array([0, 4, 0]), 10.0, 1.0,
+            np.array([False, True, True]))
+        assert propensity[0] == 0
+        assert propensity[1] == pytest.approx(np.exp(2.0))
+        assert propensity[2] == 1.0
+
+    def test_move_probabilities(self):
+        propensity = np.array([0.0, 1.0, 0.0, 3.0, 0.0, 1.0])
+        neighbours = np.array([[-1, 3, -1, 1],
+                               [-1, 4, 0, 2],
+                               [-1, 5, 1, -1],
+                               [0, -1, -1, 4],
+                               [1, -1, 3, 5],
+                               [2, -1, 4, -1]])
+        probabilities = kernels.move_probabilities(propensity, neighbours)
+        assert list(probabilities[4]) == pytest.approx([0.2, 0.0, 0.6, 0.2])
+        assert np.allclose(probabilities.sum(axis=1)[probabilities.any(1)],
+                           1)
+
+    def test_sample_directions_matches_cumulative_search(self):
+        rng = np.random.default_rng(4)
+        probabilities = rng.random((500, 4))
+        probabilities[::7, 1] = 0
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        uniforms = rng.random(500)
+        directions = kernels.sample_directions(probabilities, uniforms)
+        expected = [np.searchsorted(np.cumsum(row), u, side='right')
+                    for row, u in zip(probabilities, uniforms)]
+        assert list(directions) == list(np.minimum(expected, 3))
+        assert not np.any(directions[::7] == 1)
+
+
+class TestBackend:
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            kernels.set_backend('fortran')
+
+    def test_compiled_kernels_same_result(self):
+        """
+        The compiled kernels give the same results and leave the stream
+        in the same state as the pure Python kernels
+        """
+        jit = pytest.importorskip('biosim.jit')
+        if not jit.available:
+            pytest.skip('numba is not installed')
+        rng = np.random.default_rng(6)
+        for trial in range(20):
+            carn_fitness = rng.random(rng.integers(1, 20))
+            herb_fitness = np.sort(rng.random(rng.integers(1, 200)) * 0.8)
+            herb_weight = rng.random(len(herb_fitness)) * 30
+            streams = [RandomStream(np.random.default_rng(trial),
+                                    block_size=8) for _ in range(2)]
+            python = kernels.python_kernels['predation'](
+                carn_fitness, herb_fitness, herb_weight, 50.0, 0.2,
+                streams[0], batch_size=4)
+            compiled = jit.predation(carn_fitness, herb_fitness,
+                                     herb_weight, 50.0, 0.2, streams[1],
+                                     batch_size=4)
+            assert np.array_equal(python[0], compiled[0])
+            assert np.array_equal(python[1], compiled[1])
+            assert streams[0].normal() == streams[1].normal()
+            assert streams[0].random() == streams[1].random()
+            probabilities = rng.random((50, 4))
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            uniforms = rng.random(50)
+            assert np.array_equal(
+                kernels.python_kernels['sample_directions'](probabilities,
+                                                            uniforms),
+                jit.sample_directions(probabilities, uniforms))
+            demand = np.full(len(herb_fitness), 10.0)
+            eaten, left = jit.feed_herbivores(300.0, demand)
+            expected_eaten, expected_left = \
+                kernels.python_kernels['feed_herbivores'](300.0, demand)
+            assert np.array_equal(eaten, expected_eaten)
+            assert left == expected_left
+
+    def test_set_backend_switches_default_kernels(self):
+        try:
+            backend = kernels.set_backend('numba')
+            if backend == 'numba':
+                assert kernels.default_kernels.predation is not \
+                    kernels.python_kernels['predation']
+            assert kernels.default_backend == backend
+            assert kernels.predation is kernels.python_kernels['predation']
+        finally:
+            kernels.set_backend('python')
+        assert kernels.default_kernels.predation is \
+            kernels.python_kernels['predation']
+        assert kernels.default_kernels.births is kernels.births
+
+    def test_simulations_keep_own_backend(self):
+        """
+        A second simulation with the default backend leaves the kernels of
+        a simulation with the compiled kernels alone
+        """
+        jit = pytest.importorskip('biosim.jit')
+        if not jit.available:
+            pytest.skip('numba is not installed')
+        compiled = BioSim('OOO\nOJO\nOOO', [], seed=1, img_base=None,
+                          results_file=None, kernel_backend='numba')
+        python = BioSim('OOO\nOJO\nOOO', [], seed=1, img_base=None,
+                        results_file=None)
+        assert compiled.kernel_backend == 'numba'
+        assert python.kernel_backend == 'python'
+        island = compiled._engine.island
+        assert island.kernels.predation is jit.predation
+        assert island._cells[1, 1].kernels.feed_herbivores is \
+            jit.feed_herbivores
+        assert kernels.default_kernels.predation is \
+            kernels.python_kernels['predation']
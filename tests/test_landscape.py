@@ -117,6 +117,32 @@ class TestLandscape:
         herb1 = desert.fauna_list['Herbivore'][0]
         assert ocean.propensity_to_move(herb1) == 0
 
+    def test_propensity_computed_once(self, landscape_data, monkeypatch):
+        jungle = landscape_data['J']
+        herb1, herb2 = jungle.fauna_list['Herbivore']
+        calls = []
+        relevant_food = jungle.relevant_food
+        monkeypatch.setattr(jungle, 'relevant_food',
+                            lambda animal: calls.append(animal) or
+                            relevant_food(animal))
+        propensity = jungle.propensity_to_move(herb1)
+        assert jungle.propensity_to_move(herb2) == propensity
+        assert len(calls) == 1
+
+    def test_derived_values_invalidated(self, landscape_data):
+        jungle = landscape_data['J']
+        herb1 = jungle.fauna_list['Herbivore'][0]
+        total = jungle.total_herb_weight
+        propensity = jungle.propensity_to_move(herb1)
+        herb3 = Herbivore(weight=30.0)
+        jungle.add_animal(herb3)
+        assert jungle.total_herb_weight == pytest.approx(total + 30.0)
+        assert jungle.propensity_to_move(herb1) < propensity
+        herb3.weight = 10.0
+        assert jungle.total_herb_weight == pytest.approx(total + 10.0)
+        jungle.remaining_food['Herbivore'] = 0.0
+        assert jungle.propensity_to_move(herb1) == 1.0
+
 
 class TestOcean:
     @pytest.fixture
@@ -164,3 +190,91 @@ class TestDesert:
     def test_desert_food_available(self, desert):
         assert desert.remaining_food['Herbivore'] == 0
         assert desert.remaining_food['Carnivore'] == 0
+
+
+class TestAnimalDies:
+    def test_dead_animals_removed_from_cell_and_store(self):
+        """
+        With high omega almost all animals die, every dead animal is
+        removed from the cell and from the population store
+        """
+        jungle = Jungle()
+        herbs = [Herbivore(age=90, weight=5.0) for _ in range(50)]
+        for herb in herbs:
+            jungle.add_animal(herb)
+        omega = Herbivore.parameters['omega']
+        Herbivore.set_parameters({'omega': 1.0})
+        try:
+            jungle.animal_dies()
+        finally:
+            Herbivore.set_parameters({'omega': omega})
+        rows = jungle.fauna_rows['Herbivore']
+        assert len(rows) < 50
+        assert all(jungle.population.alive[rows])
+        dead = [herb for herb in herbs if herb.row not in rows]
+        assert not any(herb.population.alive[herb.row] for herb in dead)
+
+
+class TestRegrowFodder:
+    def test_savannah_regrows_in_closed_form(self):
+        savannah = Savannah()
+        stepwise = Savannah()
+        savannah.remaining_food['Herbivore'] = 50.0
+        stepwise.remaining_food['Herbivore'] = 50.0
+        for _ in range(4):
+            stepwise.update_fodder()
+        savannah.regrow_fodder(4)
+        assert savannah.fodder == pytest.approx(stepwise.fodder)
+        assert savannah.fodder_year == 4
+
+    def test_jungle_regrows_to_f_max(self):
+        jungle = Jungle()
+        jungle.remaining_food['Herbivore'] = 0.0
+        jungle.regrow_fodder(3)
+        assert jungle.fodder == Jungle.parameters['f_max']
+
+    def test_regrow_only_once_per_year(self):
+        savannah = Savannah()
+        savannah.remaining_food['Herbivore'] = 50.0
+        savannah.regrow_fodder(2)
+        fodder = savannah.fodder
+        savannah.regrow_fodder(2)
+        assert savannah.fodder == fodder
+
+
+class TestAnimalMigrates:
+    @pytest.fixture
+    def cells(self, monkeypatch):
+        monkeypatch.setitem(Herbivore.parameters, 'mu', 1.0)
+        jungle = Jungle()
+        store = jungle.population
+        neighbours = [Ocean(population=store), Jungle(population=store),
+                      Ocean(population=store), Ocean(population=store)]
+        for _ in range(20):
+            jungle.add_animal(Herbivore(age=5, weight=40.0))
+        return jungle, neighbours
+
+    def test_movers_applied_at_once(self, cells):
+        jungle, neighbours = cells
+        rows = jungle.fauna_rows['Herbivore']
+        moved = jungle.animal_migrates(neighbours)
+        assert len(moved) > 0
+        assert list(neighbours[1].fauna_rows['Herbivore']) == \
+            [row for row in rows if row in moved]
+        assert set(jungle.fauna_rows['Herbivore']) == set(rows) - set(moved)
+
+    def test_settled_animals_stay(self, cells):
+        jungle, neighbours = cells
+        rows = jungle.fauna_rows['Herbivore']
+        jungle.population.moved_year[rows] = 3
+        moved = jungle.animal_migrates(neighbours, year=3)
+        assert len(moved) == 0
+        assert list(jungle.fauna_rows['Herbivore']) == list(rows)
+
+    def test_movers_marked_with_year(self, cells):
+        jungle, neighbours = cells
+        moved = jungle.animal_migrates(neighbours, year=3)
+        assert len(moved) > 0
+        assert all(jungle.population.moved_year[moved] == 3)
+        assert all(jungle.population.moved_year[
+            jungle.fauna_rows['Herbivore']] == -1)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for parallel.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+import numpy as np
+
+from biosim.fauna import Herbivore
+from biosim.island import Island
+from biosim.landscape import Savannah
+from biosim.population import Population
+from biosim.parallel import ParallelIsland, strip_owners, \
+    balanced_owners, cell_costs
+
+
+class TestParallelIsland:
+    def test_strip_owners(self):
+        owners = strip_owners((5, 2), 2)
+        assert list(owners) == [0, 0, 0, 0, 0, 0, 1, 1, 1, 1]
+
+    def test_balanced_owners(self):
+        owners = balanced_owners(np.array([1, 1, 1, 1, 50, 1, 1, 1]), 3)
+        assert list(owners) == [0, 0, 0, 0, 1, 2, 2, 2]
+
+    def test_cell_costs_count_predation(self):
+        costs = cell_costs({'Herbivore': np.array([0, 10, 10]),
+                            'Carnivore': np.array([0, 0, 2])})
+        assert list(costs) == [1, 11, 33]
+
+    def test_same_result_as_island(self, island_pop):
+        """
+        Splitting the island between workers does not change the result
+        """
+        map_str, pop = island_pop
+        island = Island(map_str, seed=5)
+        island.add_animals(pop)
+        parallel = ParallelIsland(map_str, seed=5, num_workers=3)
+        try:
+            parallel.add_animals(pop)
+            for _ in range(6):
+                island.life_cycle()
+                parallel.life_cycle()
+            census = parallel.census()
+            for species in ('Herbivore', 'Carnivore'):
+                assert parallel.total_animals_per_species(species) == \
+                    island.total_animals_per_species(species)
+                counts = [[cell.cell_fauna_count[species] for cell in row]
+                          for row in island.cells]
+                assert np.array_equal(
+                    census[Population.species_codes[species]], counts)
+            assert np.array_equal(parallel.fodder_grid(),
+                                  island.fodder_grid())
+        finally:
+            parallel.close()
+
+    def test_rebalancing_keeps_result(self, island_pop):
+        """
+        Handing cells between workers does not change the result
+        """
+        map_str, pop = island_pop
+        island = Island(map_str, seed=2)
+        island.add_animals(pop)
+        parallel = ParallelIsland(map_str, seed=2, num_workers=3,
+                                  rebalance_every=1)
+        try:
+            parallel.add_animals(pop)
+            first_owners = parallel.owners.copy()
+            for _ in range(5):
+                island.life_cycle()
+                parallel.life_cycle()
+            assert not np.array_equal(parallel.owners, first_owners)
+            for species in ('Herbivore', 'Carnivore'):
+                assert parallel.total_animals_per_species(species) == \
+                    island.total_animals_per_species(species)
+            assert np.array_equal(parallel.fodder_grid(),
+                                  island.fodder_grid())
+        finally:
+            parallel.close()
+
+    def test_parameters_changed_after_start(self, island_pop, monkeypatch):
+        """
+        Parameters set after the workers were started are used by the
+        workers as well
+        """
+        map_str, pop = island_pop
+        island = Island(map_str, seed=4)
+        island.add_animals(pop)
+        parallel = ParallelIsland(map_str, seed=4, num_workers=2)
+        try:
+            parallel.add_animals(pop)
+            monkeypatch.setitem(Herbivore.parameters, 'omega', 5.0)
+            monkeypatch.setitem(Savannah.parameters, 'f_max', 100.0)
+            for _ in range(3):
+                island.life_cycle()
+                parallel.life_cycle()
+            for species in ('Herbivore', 'Carnivore'):
+                assert parallel.total_animals_per_species(species) == \
+                    island.total_animals_per_species(species)
+            assert np.array_equal(parallel.fodder_grid(),
+                                  island.fodder_grid())
+        finally:
+            parallel.close()
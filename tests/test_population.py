@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for population.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+import numpy as np
+
+from biosim.population import Population
+from biosim.fauna import Herbivore, Carnivore
+from biosim.island import Island
+from biosim.landscape import Jungle
+
+
+class TestPopulation:
+    @pytest.fixture
+    def population(self):
+        return Population(capacity=2)
+
+    def test_add_animal(self, population):
+        row = population.add('Herbivore', 3, 12.5, cell=7)
+        assert len(population) == 1
+        assert population.age[row] == 3
+        assert population.weight[row] == 12.5
+        assert population.cell[row] == 7
+        assert population.alive[row]
+
+    def test_add_many_grows_store(self, population):
+        rows = population.add_many('Carnivore', [1, 2, 3, 4, 5],
+                                   [5.0, 6.0, 7.0, 8.0, 9.0])
+        assert len(population) == 5
+        assert population.capacity >= 5
+        assert list(population.weight[rows]) == [5.0, 6.0, 7.0, 8.0, 9.0]
+        assert np.all(population.species[rows] ==
+                      Population.species_codes['Carnivore'])
+
+    def test_kill_recycles_rows(self, population):
+        rows = population.add_many('Herbivore', [1, 2, 3], [5.0, 6.0, 7.0])
+        population.kill(rows[:2])
+        assert len(population) == 1
+        assert not population.alive[rows[0]]
+        new_rows = population.add_many('Herbivore', [0, 0], [8.0, 8.0])
+        assert set(new_rows) == set(rows[:2])
+        assert len(population) == 3
+
+    def test_kill_twice(self, population):
+        row = population.add('Herbivore', 1, 5.0)
+        population.kill([row])
+        population.kill([row])
+        assert population.free_rows == [row]
+
+    def test_recycled_rows_not_moved(self, population):
+        rows = population.add_many('Herbivore', [1, 2], [5.0, 6.0])
+        population.moved_year[rows] = 1
+        population.kill(rows)
+        row = population.add('Herbivore', 0, 5.0)
+        new_rows = population.add_many('Herbivore', [0], [5.0])
+        assert set(new_rows) | {row} == set(rows)
+        assert population.moved_year[row] == -1
+        assert all(population.moved_year[new_rows] == -1)
+
+    def test_update_counts(self):
+        population = Population(num_cells=3)
+        population.update_counts('Carnivore', 2, 4)
+        population.update_counts('Carnivore', 2, -1)
+        population.update_counts('Herbivore', 0, 2)
+        assert list(population.species_counts) == [2, 3]
+        assert population.cell_counts.tolist() == [[2, 0, 0], [0, 0, 3]]
+
+
+class TestFaunaView:
+    def test_view_shares_store(self):
+        population = Population()
+        herb = Herbivore(age=2, weight=20.0, population=population)
+        view = Herbivore.view(population, herb.row)
+        view.weight = 15.0
+        assert herb.weight == 15.0
+        assert view == herb
+
+    def test_species_code(self):
+        population = Population()
+        carn = Carnivore(age=2, weight=20.0, population=population)
+        assert population.species[carn.row] == \
+            Population.species_codes['Carnivore']
+
+    def test_standalone_animals_have_own_store(self):
+        herb = Herbivore(age=2, weight=20.0)
+        carn = Carnivore(age=3, weight=30.0)
+        assert herb.population is not carn.population
+        assert len(herb.population) == 1
+        assert Jungle().population is not Jungle().population
+
+    def test_island_cells_use_island_store(self):
+        island = Island('OOO\nOJO\nOOO')
+        assert all(cell.population is island.population
+                   for cell in island.cells.flat)
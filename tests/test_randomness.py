@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for randomness.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import numpy as np
+
+from biosim.randomness import RandomStream
+
+
+class TestRandomStream:
+    def test_same_seed_same_stream(self):
+        stream1 = RandomStream(np.random.default_rng(12), block_size=4)
+        stream2 = RandomStream(np.random.default_rng(12), block_size=4)
+        assert [stream1.random() for _ in range(10)] == \
+            [stream2.random() for _ in range(10)]
+
+    def test_buffered_uniforms_match_generator(self):
+        """
+        Values handed out one by one and as arrays follow the order of the
+        generator across block borders
+        """
+        stream = RandomStream(np.random.default_rng(3), block_size=4)
+        values = [stream.random() for _ in range(3)]
+        values.extend(stream.random(7))
+        values.append(stream.random())
+        expected = np.random.default_rng(3).random(11)
+        assert np.array_equal(values, expected)
+
+    def test_buffered_normals_match_generator(self):
+        stream = RandomStream(np.random.default_rng(5), block_size=4)
+        values = [stream.normal(2.0, 0.5) for _ in range(2)]
+        values.extend(stream.normal(2.0, 0.5, size=9))
+        expected = 2.0 + 0.5 * np.random.default_rng(5).standard_normal(11)
+        assert np.allclose(values, expected)
+
+    def test_uniforms_in_unit_interval(self):
+        values = RandomStream(np.random.default_rng(1)).random(1000)
+        assert np.all((values >= 0) & (values < 1))
+
+    def test_put_back(self):
+        stream = RandomStream(np.random.default_rng(8), block_size=4)
+        values = stream.random(6)
+        stream.put_back(values[2:])
+        rest = stream.random(5)
+        expected = np.random.default_rng(8).random(7)
+        assert np.array_equal(np.concatenate((values[:2], rest)), expected)
+
+    def test_state_restores_stream(self):
+        stream = RandomStream(np.random.default_rng(8), block_size=4)
+        stream.random(3)
+        stream.normal(size=2)
+        state = stream.get_state()
+        expected = stream.random(9), stream.normal(size=5)
+        restored = RandomStream()
+        restored.set_state(state)
+        assert np.array_equal(restored.random(9), expected[0])
+        assert np.array_equal(restored.normal(size=5), expected[1])
+
+    def test_state_of_global_stream(self):
+        np.random.seed(4)
+        stream = RandomStream(block_size=4)
+        stream.random(2)
+        state = stream.get_state()
+        expected = stream.random(6)
+        np.random.seed(5)
+        stream.set_state(state)
+        assert np.array_equal(stream.random(6), expected)
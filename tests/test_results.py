@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for results.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+import numpy as np
+
+from biosim.results import ResultsWriter, read_results
+from biosim.simulation import BioSim
+
+
+def census(year):
+    return np.stack((np.full((2, 3), year), np.full((2, 3), -year)))
+
+
+class TestResultsWriter:
+    def test_chunks_read_in_order(self, tmp_path):
+        path = str(tmp_path / 'out' / 'data.npz')
+        with ResultsWriter(path, ['Herbivore', 'Carnivore'], (2, 3),
+                           chunk_years=2) as writer:
+            for year in range(1, 6):
+                writer.record(year, census(year))
+            assert writer.num_chunks == 2
+        years, counts = read_results(path)
+        assert list(years) == [1, 2, 3, 4, 5]
+        assert counts['Herbivore'].shape == (5, 2, 3)
+        assert np.array_equal(counts['Carnivore'][:, 1, 2], -years)
+
+    def test_every(self, tmp_path):
+        path = str(tmp_path / 'data.npz')
+        with ResultsWriter(path, ['Herbivore', 'Carnivore'], (2, 3),
+                           every=3) as writer:
+            for year in range(1, 10):
+                writer.record(year, census(year))
+        years, _ = read_results(path)
+        assert list(years) == [3, 6, 9]
+
+    def test_replaces_old_file(self, tmp_path):
+        path = str(tmp_path / 'data.npz')
+        with ResultsWriter(path, ['Herbivore', 'Carnivore'],
+                           (2, 3)) as writer:
+            writer.record(1, census(1))
+        ResultsWriter(path, ['Herbivore', 'Carnivore'], (2, 3))
+        years, counts = read_results(path)
+        assert len(years) == 0
+        assert counts['Herbivore'].shape == (0, 2, 3)
+
+    def test_keep_until(self, tmp_path):
+        path = str(tmp_path / 'data.npz')
+        with ResultsWriter(path, ['Herbivore', 'Carnivore'], (2, 3),
+                           chunk_years=3) as writer:
+            for year in range(1, 8):
+                writer.record(year, census(year))
+        with ResultsWriter(path, ['Herbivore', 'Carnivore'], (2, 3),
+                           chunk_years=3, keep_until=4) as writer:
+            assert writer.num_chunks == 2
+            writer.record(5, census(50))
+        years, counts = read_results(path)
+        assert list(years) == [1, 2, 3, 4, 5]
+        assert list(counts['Herbivore'][:, 0, 0]) == [1, 2, 3, 4, 50]
+
+    def test_invalid_cadence(self, tmp_path):
+        with pytest.raises(ValueError):
+            ResultsWriter(str(tmp_path / 'data.npz'), ['Herbivore'], (2, 3),
+                          every=0)
+
+
+class TestSimulationResults:
+    @pytest.fixture
+    def sim(self, tmp_path):
+        pop = [{'loc': (1, 1),
+                'pop': [{'species': 'Herbivore', 'age': 5, 'weight': 20}
+                        for _ in range(10)]}]
+        return BioSim('OOOO\nOJSO\nOOOO', pop, seed=1, img_base=None,
+                      results_file=str(tmp_path / 'results' / 'data.npz'),
+                      results_chunk=10)
+
+    def test_simulate_writes_results(self, sim):
+        sim.simulate(3, vis_years=1)
+        sim.simulate(2, vis_years=1)
+        years, counts = read_results(sim.results_file)
+        assert list(years) == [1, 2, 3, 4, 5]
+        assert counts['Herbivore'][-1].sum() == \
+            sim.num_animals_per_species['Herbivore']
+
+    def test_interrupted_simulation_keeps_years(self, sim, monkeypatch):
+        step = sim._engine.step
+
+        def interrupted_step():
+            if sim.year == 2:
+                raise KeyboardInterrupt
+            step()
+        monkeypatch.setattr(sim._engine, 'step', interrupted_step)
+        with pytest.raises(KeyboardInterrupt):
+            sim.simulate(5, vis_years=1)
+        years, _ = read_results(sim.results_file)
+        assert list(years) == [1, 2]
+
+    def test_resume_keeps_years_before_checkpoint(self, sim, tmp_path):
+        checkpoint = str(tmp_path / 'checkpoint.npz')
+        sim.simulate(10, vis_years=1)
+        sim.save_checkpoint(checkpoint)
+        sim.close()
+        with BioSim.load_checkpoint(checkpoint, img_base=None,
+                                    results_file=sim.results_file) as resumed:
+            resumed.simulate(5, vis_years=1)
+        years, counts = read_results(sim.results_file)
+        assert list(years) == list(range(1, 16))
+        assert counts['Herbivore'][-1].sum() == \
+            resumed.num_animals_per_species['Herbivore']
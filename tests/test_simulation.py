@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for simulation.py
+"""
+
+__author__ = "Hemanth Sana & Mithunan Sivagnanam"
+__email__ = "hesa@nmbu.no & misi@nmbu.no"
+
+import pytest
+import numpy as np
+
+from biosim.fauna import Herbivore, Carnivore
+from biosim.landscape import Jungle, Savannah
+from biosim.simulation import BioSim
+
+
+class TestCheckpoint:
+    @pytest.fixture(autouse=True)
+    def keep_parameters(self, monkeypatch):
+        """
+        Loading a checkpoint sets class parameters, they are put back
+        after each test
+        """
+        for parameter_class in (Herbivore, Carnivore, Jungle, Savannah):
+            monkeypatch.setattr(parameter_class, 'parameters',
+                                dict(parameter_class.parameters))
+
+    @pytest.fixture
+    def make_sim(self, island_pop):
+        geography, pop = island_pop
+
+        def make_sim():
+            return BioSim(geography, pop, seed=11, img_base=None,
+                          results_file=None)
+        return make_sim
+
+    def test_resumed_simulation_same_result(self, make_sim, tmp_path):
+        path = str(tmp_path / 'checkpoint.npz')
+        sim = make_sim()
+        sim.simulate(3, vis_years=1)
+        sim.save_checkpoint(path)
+        sim.simulate(3, vis_years=1)
+
+        resumed = BioSim.load_checkpoint(path, img_base=None,
+                                         results_file=None)
+        assert resumed.year == 3
+        resumed.simulate(3, vis_years=1)
+        assert resumed.num_animals_per_species == sim.num_animals_per_species
+        assert np.array_equal(resumed._engine.census(), sim._engine.census())
+        assert np.array_equal(resumed._engine.fodder_grid(),
+                              sim._engine.fodder_grid())
+
+    def test_parameters_restored(self, make_sim, tmp_path):
+        path = str(tmp_path / 'checkpoint.npz')
+        sim = make_sim()
+        sim.set_animal_parameters('Herbivore', {'zeta': 3.0})
+        sim.set_landscape_parameters('J', {'f_max': 700.0})
+        sim.save_checkpoint(path)
+        Herbivore.parameters['zeta'] = 1.0
+        Jungle.parameters['f_max'] = 800.0
+        BioSim.load_checkpoint(path, img_base=None, results_file=None)
+        assert Herbivore.parameters['zeta'] == 3.0
+        assert Jungle.parameters['f_max'] == 700.0